@@ -0,0 +1,123 @@
+"""
+Построение запросов по сериализатору.
+
+plan_queryset() обходит поля DRF-сериализатора и сам дописывает к запросу
+select_related (для вложенных ForeignKey и source вида "product.title"),
+prefetch_related (для many=True и ManyToMany) и only() с нужными колонками.
+Благодаря этому число запросов не зависит от размера страницы.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+
+class _Plan:
+    """Накопитель путей для одного уровня запроса"""
+
+    def __init__(self):
+        self.select = set()
+        self.prefetch = {}
+        self.only = set()
+        self.projectable = True
+
+
+def plan_queryset(queryset, serializer_class):
+    """Возвращает queryset, подготовленный под сериализацию serializer_class"""
+    plan = _Plan()
+    _collect(queryset.model, serializer_class(), "", plan)
+    return _apply(queryset, plan)
+
+
+def _apply(queryset, plan):
+    if plan.select:
+        queryset = queryset.select_related(*sorted(plan.select))
+    if plan.prefetch:
+        queryset = queryset.prefetch_related(*plan.prefetch.values())
+    if plan.projectable and plan.only:
+        queryset = queryset.only(*sorted(plan.only))
+    return queryset
+
+
+def _unwrap(field):
+    """Возвращает вложенный сериализатор или поле элемента списка"""
+    if isinstance(field, serializers.ListSerializer):
+        return field.child
+    if isinstance(field, ManyRelatedField):
+        return field.child_relation
+    return field
+
+
+def _collect(model, serializer, prefix, plan):
+    for field in _unwrap(serializer).fields.values():
+        if field.write_only:
+            continue
+        if field.source == "*":
+            if isinstance(field, serializers.BaseSerializer):
+                _collect(model, field, prefix, plan)
+            else:
+                # SerializerMethodField и т.п. могут читать любые колонки
+                plan.projectable = False
+            continue
+
+        attrs = list(field.source_attrs)
+        if attrs and attrs[-1] == "all":
+            attrs.pop()
+        _collect_path(model, attrs, field, prefix, plan)
+
+
+def _collect_path(model, attrs, field, prefix, plan):
+    node = _unwrap(field)
+    for position, attr in enumerate(attrs):
+        last = position == len(attrs) - 1
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # Свойство или метод модели - колонки заранее неизвестны
+            plan.projectable = False
+            return
+        path = prefix + attr
+
+        if not model_field.is_relation:
+            plan.only.add(path)
+            return
+
+        related_model = model_field.related_model
+        if model_field.many_to_many or model_field.one_to_many:
+            if last:
+                plan.prefetch[path] = _prefetch(path, model_field, node)
+            else:
+                # Например source="tags.count" - без колонок не обойтись
+                plan.projectable = False
+            return
+
+        # ForeignKey / OneToOne
+        if model_field.concrete:
+            plan.only.add(path)
+        if last and not isinstance(node, serializers.BaseSerializer):
+            # PrimaryKeyRelatedField читает только колонку *_id
+            return
+        # source="product.id" и вложенные сериализаторы идут через JOIN
+        plan.select.add(path)
+        if last:
+            _collect(related_model, node, path + "__", plan)
+            return
+        model = related_model
+        prefix = path + "__"
+
+
+def _prefetch(path, model_field, node):
+    """Строит Prefetch с собственным планом для связанной модели"""
+    related_model = model_field.related_model
+    plan = _Plan()
+    if isinstance(node, serializers.BaseSerializer):
+        _collect(related_model, node, "", plan)
+    elif isinstance(node, RelatedField):
+        plan.only.add(related_model._meta.pk.name)
+    else:
+        plan.projectable = False
+    if model_field.one_to_many:
+        # Для обратного ForeignKey нужна колонка связи с родителем
+        plan.only.add(model_field.field.name)
+    queryset = _apply(related_model._default_manager.all(), plan)
+    return Prefetch(path, queryset=queryset)
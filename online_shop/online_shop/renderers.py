@@ -0,0 +1,51 @@
+"""
+JSON-рендерер API.
+
+Даёт те же байты, что и rest_framework.renderers.JSONRenderer, но не
+создаёт энкодер на каждый ответ и разбирает Decimal и datetime (цены и
+даты карточек) до общей цепочки isinstance в энкодере DRF.
+"""
+import datetime
+import decimal
+import json
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+_fallback = encoders.JSONEncoder()
+
+
+def _default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+    return _fallback.default(value)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer с переиспользуемым энкодером"""
+
+    encoder = json.JSONEncoder(
+        default=_default,
+        ensure_ascii=JSONRenderer.ensure_ascii,
+        allow_nan=not JSONRenderer.strict,
+        separators=(
+            SHORT_SEPARATORS if JSONRenderer.compact else LONG_SEPARATORS
+        ),
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None:
+            # Форматированный вывод (Browsable API) - обычным путём
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = self.encoder.encode(data)
+        # Как и JSONRenderer, экранирую разделители строк для JavaScript
+        ret = ret.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
+        return ret.encode()
@@ -29,6 +29,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "frontend",
     "user",
     "product",
@@ -65,6 +66,15 @@ TEMPLATES = [
 WSGI_APPLICATION = "online_shop.wsgi.application"
 
 
+# Django REST framework
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "online_shop.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 DATABASES = {
@@ -79,6 +89,59 @@ DATABASES = {
 }
 
 
+# Cache
+# Для нескольких воркеров нужен общий кэш, например
+# django.core.cache.backends.redis.RedisCache
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", "online-shop"),
+    }
+}
+
+# Кэш ответов каталога: мягкий срок жизни (сек), во сколько раз дольше
+# хранится устаревшая копия и сколько живёт блокировка перестройки
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", 300))
+CATALOG_CACHE_STALE_FACTOR = 4
+CATALOG_CACHE_LOCK_TIMEOUT = 30
+# Сколько секунд хранится журнал изменённых продуктов по поколениям
+CATALOG_CHANGES_TTL = 24 * 60 * 60
+
+# До скольких результатов каталог и акции считаются точно (COUNT),
+# дальше - оценка планировщика или "N+"
+CATALOG_EXACT_COUNT_LIMIT = int(os.getenv("CATALOG_EXACT_COUNT_LIMIT", 1000))
+
+# Сколько последних отзывов встраивается в детальную страницу продукта
+PRODUCT_DETAIL_REVIEWS = 3
+# Размер страницы отзывов по умолчанию и максимальный
+REVIEWS_PAGE_LIMIT = 20
+REVIEWS_PAGE_MAX_LIMIT = 100
+
+# Размер страницы истории заказов по умолчанию и максимальный
+ORDERS_PAGE_LIMIT = 20
+ORDERS_PAGE_MAX_LIMIT = 100
+
+# Популярность продуктов по продажам (см. rank_popular_products)
+POPULARITY_HALF_LIFE_DAYS = 7
+POPULARITY_WINDOW_DAYS = 90
+# Заказы, подтверждённые позже этой задержки, ещё могут быть отменены и
+# не учитываются
+POPULARITY_SETTLE_MINUTES = 60
+POPULARITY_MIN_SCORE = 0.01
+# Сколько продуктов в блоке популярных
+POPULAR_PRODUCTS_LIMIT = 8
+
+# Колоночный снимок каталога (см. build_catalog_snapshot)
+CATALOG_SNAPSHOT_DIR = Path(
+    os.getenv("CATALOG_SNAPSHOT_DIR", BASE_DIR / "snapshot")
+)
+
+# Конфигурация полнотекстового поиска PostgreSQL по каталогу
+SEARCH_CONFIG = os.getenv("SEARCH_CONFIG", "russian")
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -150,3 +213,42 @@ LOGGING = {
 }
 
 PAYMENT_URL = os.getenv("PAYMENT_URL", "http://localhost:5000/api/payment")
+# Хранилище корзин: order.basket.DatabaseBasketStore пишет сразу в базу,
+# order.basket.CachedBasketStore держит корзины в кэше и сбрасывает их в
+# базу командой flush_baskets и при оформлении заказа. Кэш-хранилищу нужен
+# общий кэш без вытеснения (Redis), иначе корзины теряются (order.W001)
+BASKET_STORE = os.getenv("BASKET_STORE", "order.basket.DatabaseBasketStore")
+BASKET_LOCK_TIMEOUT = 2
+# Сколько секунд журнал изменений корзин ждёт flush_baskets
+BASKET_JOURNAL_TTL = 60 * 60 * 24
+
+# Сколько минут товар держится в резерве под неоплаченный заказ
+STOCK_RESERVATION_MINUTES = 15
+
+# Отправка платежей из outbox (см. drain_payment_outbox). Время повторов
+# (PAYMENT_RETRY_BASE_SECONDS * 2^n, не больше PAYMENT_RETRY_MAX_SECONDS)
+# должно укладываться в STOCK_RESERVATION_MINUTES
+PAYMENT_CONNECT_TIMEOUT = 3.05
+PAYMENT_READ_TIMEOUT = 10
+PAYMENT_MAX_ATTEMPTS = 6
+PAYMENT_RETRY_BASE_SECONDS = 2
+PAYMENT_RETRY_MAX_SECONDS = 120
+# Через сколько секунд запрос, взятый упавшим воркером, берётся снова
+PAYMENT_LEASE_SECONDS = 60
+PAYMENT_WORKERS = 4
+# Быстрые повторы внутри одной попытки (отказ соединения, 502/503/504)
+PAYMENT_CLIENT_RETRIES = 2
+# После стольких ошибок подряд запросы не отправляются RESET_SECONDS секунд
+PAYMENT_BREAKER_FAILURES = 5
+PAYMENT_BREAKER_RESET_SECONDS = 30
+
+# Локальный эмулятор платёжного сервиса для разработки и нагрузочных
+# тестов: PAYMENT_URL=http://localhost:8000/api/payment-simulator
+PAYMENT_SIMULATOR = os.getenv("PAYMENT_SIMULATOR", "False") in [
+    "True",
+    "true",
+]
+PAYMENT_SIMULATOR_LATENCY = float(os.getenv("PAYMENT_SIMULATOR_LATENCY", 0.2))
+PAYMENT_SIMULATOR_ERROR_RATE = float(
+    os.getenv("PAYMENT_SIMULATOR_ERROR_RATE", 0)
+)
@@ -1,5 +1,12 @@
 from django.contrib import admin
-from .models import BasketItem, Order, DeliverySettings, OrderItem
+from .models import (
+    BasketItem,
+    Order,
+    DeliverySettings,
+    OrderItem,
+    PaymentOutbox,
+    StockReservation,
+)
 
 
 @admin.register(BasketItem)
@@ -16,10 +23,10 @@ class BasketItemAdmin(admin.ModelAdmin):
 class OrderItemAdmin(admin.ModelAdmin):
     """Админка для предметов заказа"""
 
-    list_display = ("id", "order", "product", "count")
+    list_display = ("id", "order", "product", "count", "price")
     list_filter = ("order", "product")
     search_fields = ("order__fullName", "product__title")
-    readonly_fields = ("id", "order", "product", "count")
+    readonly_fields = ("id", "order", "product", "count", "price", "snapshot")
 
 
 @admin.register(Order)
@@ -32,6 +39,7 @@ class OrderAdmin(admin.ModelAdmin):
         "fullName",
         "status",
         "createdAt",
+        "confirmedAt",
         "totalCost",
     )
     list_filter = ("status", "createdAt", "user")
@@ -42,10 +50,62 @@ class OrderAdmin(admin.ModelAdmin):
         "fullName",
         "status",
         "createdAt",
+        "confirmedAt",
         "totalCost",
     )
 
 
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    """Админка для резервов товара"""
+
+    list_display = (
+        "id",
+        "order",
+        "product",
+        "count",
+        "status",
+        "expires_at",
+    )
+    list_filter = ("status",)
+    search_fields = ("order__fullName", "product__title")
+    readonly_fields = (
+        "id",
+        "order",
+        "product",
+        "count",
+        "status",
+        "created_at",
+        "expires_at",
+    )
+
+
+@admin.register(PaymentOutbox)
+class PaymentOutboxAdmin(admin.ModelAdmin):
+    """Админка для очереди платежей"""
+
+    list_display = (
+        "id",
+        "order",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "updated_at",
+    )
+    list_filter = ("status",)
+    search_fields = ("order__fullName", "key")
+    readonly_fields = (
+        "id",
+        "order",
+        "key",
+        "payload",
+        "confirmation_url",
+        "last_error",
+        "created_at",
+        "updated_at",
+    )
+
+
 class DeliverySettingsAdmin(admin.ModelAdmin):
     """Админка для настроек доставки (один объект)"""
 
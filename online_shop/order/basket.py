@@ -0,0 +1,333 @@
+"""
+Хранилище корзин.
+
+Корзина - упорядоченный набор строк {id продукта: количество}.
+DatabaseBasketStore читает и пишет BasketItem напрямую. CachedBasketStore
+держит корзину в кэше, а в базу сбрасывает её позже (write-behind):
+каждое изменение записывается в журнал в кэше, команда flush_baskets
+сбрасывает изменённые корзины, а оформление заказа сбрасывает корзину
+покупателя сразу. Для нескольких процессов кэш должен быть общим
+(Redis), иначе корзины процессов разойдутся.
+
+Ответ корзины собирается из карточек продуктов (cards.py) одной пачкой
+запросов на всю корзину.
+"""
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from product.cache import bump_counter, get_counter
+from product.cards import product_cards_by_id
+from product.models import Product
+from .models import BasketItem
+
+BASKET_KEY = "basket:{}"
+LOCK_KEY = "basket:lock:{}"
+JOURNAL_KEY = "basket:journal:{}"
+JOURNAL_COUNTER_KEY = "basket:journal"
+FLUSHED_KEY = "basket:flushed"
+
+
+class ProductNotFound(Exception):
+    """Такого продукта нет"""
+
+    def __init__(self, product_id=None):
+        super().__init__(f"Product {product_id} not found")
+        self.product_id = product_id
+
+
+class NotEnoughStock(Exception):
+    """В корзине стало бы больше товара, чем есть на складе"""
+
+    def __init__(self, product_id=None):
+        super().__init__(f"Not enough stock for product {product_id}")
+        self.product_id = product_id
+
+
+class NotInBasket(Exception):
+    """Продукта нет в корзине"""
+
+
+# Добавление строки одним запросом: вставка идёт, только если на складе
+# есть count штук, а при существующей строке (user, product) количество
+# увеличивается, только если сумма не превышает остаток на складе
+ADD_SQL = """
+INSERT INTO {basket} (user_id, product_id, count, added_at)
+SELECT %s, {product}.id, %s, %s FROM {product}
+WHERE {product}.id = %s AND {product}.count >= %s
+ON CONFLICT (user_id, product_id) DO UPDATE
+SET count = {basket}.count + excluded.count
+WHERE {basket}.count + excluded.count <= (
+    SELECT {product}.count FROM {product}
+    WHERE {product}.id = excluded.product_id
+)
+RETURNING count
+"""
+
+
+def apply_deltas(lines, deltas, stock):
+    """
+    Применяет к строкам корзины изменения {id продукта: +-количество}
+    с остатками stock {id продукта: остаток} и возвращает новые строки.
+    Строки с количеством 0 и меньше удаляются.
+    """
+    lines = dict(lines)
+    for product_id, delta in deltas.items():
+        count = lines.get(product_id, 0) + delta
+        if count <= 0:
+            lines.pop(product_id, None)
+            continue
+        if product_id not in stock:
+            raise ProductNotFound(product_id)
+        if count > stock[product_id]:
+            raise NotEnoughStock(product_id)
+        lines[product_id] = count
+    return lines
+
+
+def _stock(product_ids):
+    """Остатки продуктов одним запросом"""
+    return dict(
+        Product.objects.filter(pk__in=product_ids).values_list("pk", "count")
+    )
+
+
+class DatabaseBasketStore:
+    """Корзины в таблице BasketItem"""
+
+    def lines(self, user_id):
+        """Строки корзины в порядке добавления"""
+        items = (
+            BasketItem.objects.filter(user_id=user_id)
+            .order_by("added_at", "pk")
+            .values_list("product_id", "count")
+        )
+        return dict(items)
+
+    def add(self, user_id, product_id, count):
+        """Добавляет count штук продукта, если хватает товара на складе"""
+        ops = connection.ops
+        sql = ADD_SQL.format(
+            basket=ops.quote_name(BasketItem._meta.db_table),
+            product=ops.quote_name(Product._meta.db_table),
+        )
+        now = ops.adapt_datetimefield_value(timezone.now())
+        # Корзина читается в той же транзакции, что и запись, поэтому
+        # ответ соответствует только что сделанному изменению
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [user_id, count, now, product_id, count])
+                added = cursor.fetchone()
+            if added is not None:
+                return self.lines(user_id)
+        # Вставка не прошла - выясняю почему (только в случае отказа)
+        if not Product.objects.filter(pk=product_id).exists():
+            raise ProductNotFound()
+        raise NotEnoughStock()
+
+    def remove(self, user_id, product_id, count):
+        """Убирает count штук продукта (всю строку, если меньше)"""
+        item = BasketItem.objects.filter(
+            user_id=user_id, product_id=product_id
+        )
+        # Условное уменьшение, а если остаётся не больше count - удаление.
+        # Строку могли изменить между запросами, тогда пробую снова
+        with transaction.atomic():
+            while True:
+                if item.filter(count__gt=count).update(
+                    count=F("count") - count
+                ):
+                    break
+                if item.filter(count__lte=count).delete()[0]:
+                    break
+                if not item.exists():
+                    raise NotInBasket()
+            return self.lines(user_id)
+
+    def apply(self, user_id, deltas):
+        """
+        Применяет пачку изменений {id продукта: +-количество} целиком или
+        никак (ProductNotFound, NotEnoughStock) и возвращает корзину.
+        """
+        with transaction.atomic():
+            current = dict(
+                BasketItem.objects.select_for_update()
+                .filter(user_id=user_id)
+                .order_by("added_at", "pk")
+                .values_list("product_id", "count")
+            )
+            lines = apply_deltas(current, deltas, _stock(deltas))
+            BasketItem.objects.filter(
+                user_id=user_id, product_id__in=set(current) - set(lines)
+            ).delete()
+            self._upsert(
+                user_id,
+                {
+                    pid: count
+                    for pid, count in lines.items()
+                    if current.get(pid) != count
+                },
+            )
+        return lines
+
+    def clear(self, user_id):
+        BasketItem.objects.filter(user_id=user_id).delete()
+
+    def flush(self, user_id):
+        """Изменения уже в базе"""
+
+    def replace(self, user_id, lines):
+        """Записывает корзину в базу целиком"""
+        # Удалённые продукты из корзины выпадают
+        lines = {
+            pk: lines[pk]
+            for pk in Product.objects.filter(pk__in=lines).values_list(
+                "pk", flat=True
+            )
+        }
+        with transaction.atomic():
+            BasketItem.objects.filter(user_id=user_id).exclude(
+                product_id__in=lines
+            ).delete()
+            self._upsert(user_id, lines)
+
+    def _upsert(self, user_id, lines):
+        """Вставляет строки, а существующим обновляет количество"""
+        BasketItem.objects.bulk_create(
+            [
+                BasketItem(user_id=user_id, product_id=pid, count=count)
+                for pid, count in lines.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["user", "product"],
+            update_fields=["count"],
+        )
+
+
+class CachedBasketStore(DatabaseBasketStore):
+    """Корзины в кэше с отложенной записью в базу"""
+
+    def lines(self, user_id):
+        lines = cache.get(BASKET_KEY.format(user_id))
+        if lines is None:
+            lines = super().lines(user_id)
+            cache.add(BASKET_KEY.format(user_id), lines, timeout=None)
+        return dict(lines)
+
+    @contextmanager
+    def _locked(self, user_id):
+        """Блокировка корзины на время чтения-изменения-записи"""
+        key = LOCK_KEY.format(user_id)
+        deadline = time.monotonic() + settings.BASKET_LOCK_TIMEOUT
+        while not cache.add(key, 1, timeout=settings.BASKET_LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                # Владелец блокировки завис - она скоро истечёт сама
+                break
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            cache.delete(key)
+
+    def _save(self, user_id, lines):
+        cache.set(BASKET_KEY.format(user_id), lines, timeout=None)
+        seq = bump_counter(JOURNAL_COUNTER_KEY)
+        cache.set(
+            JOURNAL_KEY.format(seq),
+            user_id,
+            timeout=settings.BASKET_JOURNAL_TTL,
+        )
+        return dict(lines)
+
+    def add(self, user_id, product_id, count):
+        stock = (
+            Product.objects.filter(pk=product_id)
+            .values_list("count", flat=True)
+            .first()
+        )
+        if stock is None:
+            raise ProductNotFound()
+        with self._locked(user_id):
+            lines = self.lines(user_id)
+            if lines.get(product_id, 0) + count > stock:
+                raise NotEnoughStock()
+            lines[product_id] = lines.get(product_id, 0) + count
+            return self._save(user_id, lines)
+
+    def remove(self, user_id, product_id, count):
+        with self._locked(user_id):
+            lines = self.lines(user_id)
+            if product_id not in lines:
+                raise NotInBasket()
+            if count >= lines[product_id]:
+                del lines[product_id]
+            else:
+                lines[product_id] -= count
+            return self._save(user_id, lines)
+
+    def apply(self, user_id, deltas):
+        stock = _stock(deltas)
+        with self._locked(user_id):
+            lines = apply_deltas(self.lines(user_id), deltas, stock)
+            return self._save(user_id, lines)
+
+    def clear(self, user_id):
+        with self._locked(user_id):
+            cache.set(BASKET_KEY.format(user_id), {}, timeout=None)
+            super().clear(user_id)
+
+    def flush(self, user_id):
+        """Записывает корзину из кэша в базу"""
+        lines = cache.get(BASKET_KEY.format(user_id))
+        if lines is not None:
+            self.replace(user_id, lines)
+
+
+def get_basket_store():
+    """Хранилище корзин из настройки BASKET_STORE"""
+    return import_string(settings.BASKET_STORE)()
+
+
+def _journal(since, until):
+    """Записи журнала корзин с номерами (since, until]"""
+    keys = [JOURNAL_KEY.format(seq) for seq in range(since + 1, until + 1)]
+    return cache.get_many(keys)
+
+
+def flush_dirty_baskets(limit=1000):
+    """
+    Сбрасывает в базу корзины, изменённые после прошлого запуска (не
+    больше limit записей журнала), и возвращает число корзин.
+    """
+    store = get_basket_store()
+    flushed = cache.get(FLUSHED_KEY)
+    current = get_counter(JOURNAL_COUNTER_KEY)
+    if flushed is None or flushed > current:
+        # Первый запуск или отметка сброса была вытеснена из кэша
+        flushed = max(current - limit, 0)
+    until = min(current, flushed + limit)
+    entries = _journal(flushed, until)
+    if not entries and until < current:
+        # Записей после отметки нет: счётчик журнала был вытеснен и начат
+        # заново с текущего времени (или записи истекли). Перехожу сразу
+        # к последним limit записям, иначе каждый запуск проходил бы лишь
+        # limit пустых ключей и до новых записей не добрался бы никогда
+        flushed, until = current - limit, current
+        entries = _journal(flushed, until)
+    user_ids = set(entries.values())
+    for user_id in user_ids:
+        store.flush(user_id)
+    cache.set(FLUSHED_KEY, until, timeout=None)
+    return len(user_ids)
+
+
+def basket_cards(lines):
+    """Ответ корзины: карточки продуктов с количеством в корзине"""
+    return [
+        dict(card, count=lines[card["id"]])
+        for card in product_cards_by_id(list(lines))
+    ]
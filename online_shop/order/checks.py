@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+from django.utils.module_loading import import_string
+
+# Кэши, общие для всех процессов и не вытесняющие записи без срока жизни
+SHARED_CACHES = ("django.core.cache.backends.redis.RedisCache",)
+
+
+@register()
+def check_basket_store(app_configs, **kwargs):
+    """
+    CachedBasketStore хранит корзину только в кэше до flush_baskets.
+    В LocMemCache она вытесняется и не видна другим процессам.
+    """
+    from .basket import CachedBasketStore
+
+    store = import_string(settings.BASKET_STORE)
+    backend = settings.CACHES["default"]["BACKEND"]
+    if issubclass(store, CachedBasketStore) and backend not in SHARED_CACHES:
+        return [
+            Warning(
+                f"{settings.BASKET_STORE} needs a shared cache, "
+                f"but the default cache is {backend}.",
+                hint="Set CACHE_BACKEND to "
+                "django.core.cache.backends.redis.RedisCache or use "
+                "BASKET_STORE=order.basket.DatabaseBasketStore.",
+                id="order.W001",
+            )
+        ]
+    return []
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from order.models import OrderItem
+from order.snapshots import product_snapshots
+
+
+class Command(BaseCommand):
+    """
+    Заполняет цену и снимок продукта у позиций заказов, оформленных до
+    появления снимков. Историческая цена неизвестна, поэтому берётся
+    текущая цена продукта. Повторный запуск обрабатывает только
+    незаполненные позиции.
+    """
+
+    help = "Fill price and product snapshot of order items created before"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Order items updated per query",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        items = OrderItem.objects.filter(price__isnull=True).order_by("pk")
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                items.filter(pk__gt=last_pk)
+                .select_related("product")
+                .only("pk", "product__effective_price")[:batch_size]
+            )
+            if not batch:
+                break
+            snapshots = product_snapshots({item.product_id for item in batch})
+            for item in batch:
+                item.price = item.product.effective_price
+                item.snapshot = snapshots[item.product_id]
+            OrderItem.objects.bulk_update(batch, ["price", "snapshot"])
+            updated += len(batch)
+            last_pk = batch[-1].pk
+        self.stdout.write(f"Backfilled {updated} order items")
@@ -0,0 +1,53 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from order.outbox import drain_outbox
+from order.payment import PaymentClient, create_session
+
+
+class Command(BaseCommand):
+    """
+    Отправляет запросы на оплату из outbox в платёжный сервис. С --watch
+    работает постоянно, переиспользуя соединения с платёжным сервисом.
+    """
+
+    help = "Send pending payment requests to the payment service"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.PAYMENT_WORKERS,
+            help="Requests sent in parallel",
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=100,
+            help="Requests claimed per round",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep running and send new requests as they appear",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds between polls in --watch mode when idle",
+        )
+
+    def handle(self, *args, **options):
+        client = PaymentClient(session=create_session(options["workers"]))
+        total = 0
+        while True:
+            sent = drain_outbox(
+                client, limit=options["batch"], workers=options["workers"]
+            )
+            total += sent
+            if not options["watch"]:
+                break
+            if not sent:
+                time.sleep(options["interval"])
+        self.stdout.write(f"Processed {total} payment requests")
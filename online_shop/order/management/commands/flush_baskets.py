@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from order.basket import flush_dirty_baskets
+
+
+class Command(BaseCommand):
+    """
+    Сбрасывает изменённые корзины из кэша в базу (BasketItem). С --watch
+    работает постоянно.
+    """
+
+    help = "Write baskets changed in the cache back to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep running and flush baskets as they change",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds between flushes in --watch mode",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = flush_dirty_baskets()
+            if flushed or not options["watch"]:
+                self.stdout.write(f"Flushed {flushed} baskets")
+            if not options["watch"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from order.popularity import rank_popular_products
+
+
+class Command(BaseCommand):
+    """
+    Обновляет популярность продуктов по новым подтверждённым заказам.
+    Запускается периодически (cron), каждый запуск обрабатывает только
+    заказы после предыдущего.
+    """
+
+    help = "Update sales-based product popularity from new confirmed orders"
+
+    def handle(self, *args, **options):
+        updated = rank_popular_products()
+        self.stdout.write(f"Popularity updated for {updated} products")
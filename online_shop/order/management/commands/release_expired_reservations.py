@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from order.stock import release_expired_reservations
+
+
+class Command(BaseCommand):
+    """
+    Возвращает на склад товар из просроченных резервов (заказы, которые
+    так и не были оплачены). Запускается периодически (cron).
+    """
+
+    help = "Release expired stock reservations back to stock"
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+        self.stdout.write(f"Released {released} reservations")
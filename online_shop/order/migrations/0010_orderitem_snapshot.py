@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("order", "0009_alter_deliverysettings_options"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="orderitem",
+            name="price",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=10, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderitem",
+            name="snapshot",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    """Складывает дубли строк корзины в самую раннюю строку"""
+    BasketItem = apps.get_model("order", "BasketItem")
+    duplicates = (
+        BasketItem.objects.values("user_id", "product_id")
+        .annotate(lines=Count("pk"), first=Min("pk"), total=Sum("count"))
+        .filter(lines__gt=1)
+        .order_by()
+    )
+    for row in duplicates:
+        lines = BasketItem.objects.filter(
+            user_id=row["user_id"], product_id=row["product_id"]
+        )
+        lines.exclude(pk=row["first"]).delete()
+        lines.filter(pk=row["first"]).update(count=row["total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("order", "0012_payment_outbox"),
+        ("product", "0016_review_date_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="basketitem",
+            constraint=models.UniqueConstraint(
+                fields=("user", "product"), name="unique_basket_line"
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="basketitem",
+            name="order_baske_user_id_366cae_idx",
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("order", "0013_unique_basket_line"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["user", "createdAt", "id"],
+                name="order_order_user_id_6617a4_idx",
+            ),
+        ),
+        # Составной индекс покрывает и выборку по user
+        migrations.RemoveIndex(
+            model_name="order",
+            name="order_order_user_id_a7f1ea_idx",
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:29
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_confirmed_at(apps, schema_editor):
+    """
+    У уже подтверждённых заказов отметкой подтверждения считается дата
+    оформления: по ней их и учитывал рейтинг популярности, поэтому
+    учтённые продажи не засчитываются повторно.
+    """
+    Order = apps.get_model("order", "Order")
+    Order.objects.filter(status__in=("confirmed", "paid")).update(
+        confirmedAt=F("createdAt")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("order", "0014_order_history_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="confirmedAt",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_confirmed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["confirmedAt"], name="order_order_confirm_9593ec_idx"
+            ),
+        ),
+    ]
@@ -1,4 +1,6 @@
+import uuid
 from django.db import models
+from django.utils import timezone
 from user.models import User
 from product.models import Product
 
@@ -14,8 +16,13 @@ class BasketItem(models.Model):
     added_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        # Уникальный индекс (user, product) обслуживает и поиск по user
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "product"], name="unique_basket_line"
+            ),
+        ]
         indexes = [
-            models.Index(fields=["user"]),
             models.Index(fields=["product"]),
         ]
 
@@ -37,14 +44,18 @@ class Order(models.Model):
     paymentType = models.CharField(max_length=50)
     totalCost = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=50, default="accepted")
+    # Когда заказ подтверждён оплатой, по этой отметке учитываются продажи
+    confirmedAt = models.DateTimeField(null=True, blank=True)
     city = models.CharField(max_length=100)
     address = models.CharField(max_length=255)
     products = models.ManyToManyField("OrderItem", related_name="orders")
 
     class Meta:
         indexes = [
-            models.Index(fields=["user"]),
+            # История заказов пользователя (keyset по паре createdAt, id)
+            models.Index(fields=["user", "createdAt", "id"]),
             models.Index(fields=["createdAt"]),
+            models.Index(fields=["confirmedAt"]),
         ]
 
     def __str__(self):
@@ -57,6 +68,12 @@ class OrderItem(models.Model):
     )
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     count = models.PositiveIntegerField()
+    # Цена за штуку и данные продукта на момент оформления (snapshots.py).
+    # У старых заказов заполняются командой backfill_order_items
+    price = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True
+    )
+    snapshot = models.JSONField(default=dict, blank=True)
 
     class Meta:
         indexes = [
@@ -68,6 +85,82 @@ class OrderItem(models.Model):
         return f"{self.order} - {self.product} ({self.count})"
 
 
+class StockReservation(models.Model):
+    """
+    Товар, зарезервированный под заказ. Остаток продукта уменьшается
+    при резервировании; held-резерв либо подтверждается после оплаты,
+    либо снимается (ошибка оплаты, истёк срок), возвращая товар на склад.
+    """
+
+    HELD = "held"
+    COMMITTED = "committed"
+    RELEASED = "released"
+    STATUSES = [
+        (HELD, "Held"),
+        (COMMITTED, "Committed"),
+        (RELEASED, "Released"),
+    ]
+
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name="reservations"
+    )
+    product = models.ForeignKey(Product, on_delete=models.PROTECT)
+    count = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=HELD)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["order", "status"]),
+            # Поиск просроченных резервов
+            models.Index(fields=["status", "expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.order} - {self.product} ({self.count}, {self.status})"
+
+
+class PaymentOutbox(models.Model):
+    """
+    Запрос на оплату заказа. Пишется в транзакции оформления заказа и
+    отправляется в платёжный сервис фоновым воркером (outbox.py), так что
+    ответ пользователю не ждёт платёжный сервис.
+    """
+
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUSES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name="payments"
+    )
+    # Ключ идемпотентности: повторы одного запроса не создают два платежа
+    key = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # Не раньше этого времени запрос берётся в работу (повтор, аренда)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    confirmation_url = models.URLField(max_length=2000, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"Payment for {self.order} ({self.status})"
+
+
 class DeliverySettings(models.Model):
     """Модель настроек доставки"""
 
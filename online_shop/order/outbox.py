@@ -0,0 +1,189 @@
+"""
+Отправка платежей через outbox.
+
+Оформление заказа только резервирует товар и пишет запрос на оплату в
+таблицу PaymentOutbox в той же транзакции, поэтому время ответа не
+зависит от платёжного сервиса. Воркеры (drain_payment_outbox) забирают
+запросы пачками с SELECT ... FOR UPDATE SKIP LOCKED, отправляют их через
+общий PaymentClient (payment.py) и записывают результат: ссылку на
+оплату или ошибку. Неудачные попытки
+повторяются с экспоненциальной задержкой; взятый запрос "арендуется" на
+PAYMENT_LEASE_SECONDS, чтобы после падения воркера его взял другой.
+Фронт узнаёт ссылку на оплату, опрашивая /api/order/<id>/payment.
+"""
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .basket import get_basket_store
+from .models import Order, PaymentOutbox, StockReservation
+from .payment import CircuitOpen, PaymentError
+from .stock import (
+    OutOfStock,
+    commit_reservations,
+    release_order,
+    reserve_order,
+)
+
+log = logging.getLogger(__name__)
+
+
+def enqueue_payment(order, amount):
+    """
+    Записывает запрос на оплату заказа. Вызывается в транзакции
+    оформления; для заказа с неотправленным или отправленным запросом
+    возвращает его же.
+    """
+    entry = (
+        order.payments.exclude(status=PaymentOutbox.FAILED)
+        .order_by("-pk")
+        .first()
+    )
+    if entry:
+        return entry
+    return PaymentOutbox.objects.create(
+        order=order,
+        payload={
+            "amount": {"value": str(amount), "currency": "RUB"},
+            "user_id": str(order.user_id),
+            "order_id": order.id,
+        },
+    )
+
+
+def payment_status(entry):
+    """Состояние запроса на оплату для фронта"""
+    return {
+        "orderId": entry.order_id,
+        "status": entry.status,
+        "confirmation_url": entry.confirmation_url or None,
+        "error": entry.last_error or None,
+    }
+
+
+def claim_batch(limit, now=None):
+    """
+    Забирает до limit готовых к отправке запросов. Параллельные воркеры
+    пропускают строки, заблокированные друг другом.
+    """
+    now = now or timezone.now()
+    lease = now + timedelta(seconds=settings.PAYMENT_LEASE_SECONDS)
+    with transaction.atomic():
+        entries = list(
+            PaymentOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=PaymentOutbox.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "pk")[:limit]
+        )
+        PaymentOutbox.objects.filter(
+            pk__in=[entry.pk for entry in entries]
+        ).update(next_attempt_at=lease, attempts=F("attempts") + 1)
+    for entry in entries:
+        entry.next_attempt_at = lease
+        entry.attempts += 1
+    return entries
+
+
+def _confirm(entry, payment_url):
+    with transaction.atomic():
+        entry.status = PaymentOutbox.SENT
+        entry.confirmation_url = payment_url
+        entry.last_error = ""
+        entry.save(update_fields=["status", "confirmation_url", "last_error"])
+        if not commit_reservations(entry.order):
+            # Резерв успел истечь во время оплаты - резервирую заново
+            reserve_order(entry.order)
+            commit_reservations(entry.order)
+        Order.objects.filter(pk=entry.order_id).update(
+            status="confirmed",
+            confirmedAt=Coalesce(F("confirmedAt"), Value(timezone.now())),
+        )
+        get_basket_store().clear(entry.order.user_id)
+    log.info(f"Order {entry.order_id} payment confirmed")
+
+
+def _fail(entry, error):
+    with transaction.atomic():
+        entry.status = PaymentOutbox.FAILED
+        entry.last_error = error
+        entry.save(update_fields=["status", "last_error"])
+        # Оплата не прошла - товар возвращается на склад
+        release_order(entry.order)
+        Order.objects.filter(pk=entry.order_id).update(status="canceled")
+    log.error(f"Payment failed for order {entry.order_id}: {error}")
+
+
+def _retry(entry, error, now):
+    delay = min(
+        settings.PAYMENT_RETRY_BASE_SECONDS * 2 ** (entry.attempts - 1),
+        settings.PAYMENT_RETRY_MAX_SECONDS,
+    )
+    # Случайная часть задержки разводит повторы разных заказов
+    entry.next_attempt_at = now + timedelta(
+        seconds=random.uniform(delay / 2, delay)
+    )
+    entry.last_error = error
+    entry.save(update_fields=["next_attempt_at", "last_error"])
+    log.warning(
+        f"Payment for order {entry.order_id} failed "
+        f"(attempt {entry.attempts}), retrying: {error}"
+    )
+
+
+def dispatch(entry, client, now=None):
+    """Отправляет один запрос и записывает результат"""
+    held = entry.order.reservations.filter(status=StockReservation.HELD)
+    if not held.exists():
+        _fail(entry, "Stock reservation expired")
+        return
+    try:
+        payment_url = client.create_payment(entry.payload, entry.key)
+    except CircuitOpen as e:
+        # Запрос не отправлялся - попытка не засчитывается
+        entry.attempts -= 1
+        entry.next_attempt_at = (now or timezone.now()) + timedelta(
+            seconds=e.retry_after
+        )
+        entry.save(update_fields=["attempts", "next_attempt_at"])
+        return
+    except PaymentError as e:
+        if e.retry and entry.attempts < settings.PAYMENT_MAX_ATTEMPTS:
+            _retry(entry, str(e), now or timezone.now())
+        else:
+            _fail(entry, str(e))
+        return
+    try:
+        _confirm(entry, payment_url)
+    except OutOfStock as e:
+        _fail(entry, str(e))
+
+
+def _dispatch_in_thread(entry, client):
+    try:
+        dispatch(entry, client)
+    except Exception:
+        # Запрос вернётся в работу, когда истечёт аренда
+        log.exception(f"Payment dispatch crashed for order {entry.order_id}")
+    finally:
+        connection.close()
+
+
+def drain_outbox(client, limit=100, workers=None):
+    """
+    Отправляет пачку готовых запросов пулом из workers потоков и
+    возвращает число обработанных.
+    """
+    workers = workers or settings.PAYMENT_WORKERS
+    entries = claim_batch(limit)
+    if workers == 1:
+        for entry in entries:
+            dispatch(entry, client)
+    elif entries:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for entry in entries:
+                pool.submit(_dispatch_in_thread, entry, client)
+    return len(entries)
@@ -0,0 +1,148 @@
+"""
+Клиент платёжного сервиса.
+
+Один PaymentClient на процесс воркера: общая сессия requests с пулом
+keep-alive соединений, таймауты на соединение и чтение, ограниченные
+повторы и автомат защиты (circuit breaker). Запрос на оплату несёт ключ
+идемпотентности, поэтому его можно безопасно повторить - сервис не
+создаст второй платёж. Пока сервис лежит, автомат разомкнут и клиент
+сразу отвечает CircuitOpen, не занимая воркеры ожиданием таймаутов.
+"""
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+SUCCESS_CODES = (200, 201, 202, 204)
+# Ответы 4xx, кроме этих, означают отказ, а не временную ошибку
+RETRY_CODES = (408, 409, 425, 429)
+
+
+class PaymentError(Exception):
+    """Платёжный сервис не принял запрос"""
+
+    def __init__(self, message, retry=True):
+        super().__init__(message)
+        self.retry = retry
+
+
+class CircuitOpen(PaymentError):
+    """Платёжный сервис недоступен, запросы временно не отправляются"""
+
+    def __init__(self, retry_after):
+        super().__init__("Payment service circuit is open")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    После failure_threshold ошибок подряд размыкается на reset_timeout
+    секунд. Затем пропускает один пробный запрос: успех замыкает его,
+    ошибка снова размыкает.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """Бросает CircuitOpen, если запрос сейчас отправлять нельзя"""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - self.clock()
+            if remaining > 0 or self.probing:
+                raise CircuitOpen(max(remaining, 0))
+            self.probing = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.probing = False
+
+
+def create_session(pool_size=None):
+    """
+    Сессия с пулом keep-alive соединений на pool_size потоков. Повторяет
+    только отказы соединения и 502/503/504 - запросы с ключом
+    идемпотентности, включая POST, повторять безопасно.
+    """
+    pool_size = pool_size or settings.PAYMENT_WORKERS
+    retries = Retry(
+        total=settings.PAYMENT_CLIENT_RETRIES,
+        read=0,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=None,
+        backoff_factor=0.2,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=pool_size, max_retries=retries
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class PaymentClient:
+    """Клиент платёжного сервиса, общий для потоков воркера"""
+
+    def __init__(self, session=None, breaker=None, url=None):
+        self.session = session or create_session()
+        self.breaker = breaker or CircuitBreaker(
+            settings.PAYMENT_BREAKER_FAILURES,
+            settings.PAYMENT_BREAKER_RESET_SECONDS,
+        )
+        self.url = url or settings.PAYMENT_URL
+        self.timeout = (
+            settings.PAYMENT_CONNECT_TIMEOUT,
+            settings.PAYMENT_READ_TIMEOUT,
+        )
+
+    def create_payment(self, payload, idempotency_key):
+        """Создаёт платёж и возвращает ссылку на оплату"""
+        self.breaker.before_call()
+        try:
+            response = self.session.post(
+                self.url,
+                json=payload,
+                headers={"Idempotence-Key": str(idempotency_key)},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            raise PaymentError(str(e))
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            # Отказ 4xx - ответ исправного сервиса
+            self.breaker.record_success()
+        if response.status_code not in SUCCESS_CODES:
+            retry = (
+                response.status_code >= 500
+                or response.status_code in RETRY_CODES
+            )
+            raise PaymentError(f"Error: {response.text}", retry=retry)
+        try:
+            payment_url = response.json().get("confirmation_url")
+        except (ValueError, AttributeError):
+            payment_url = None
+        if not payment_url:
+            raise PaymentError("No confirmation_url in response", retry=False)
+        return payment_url
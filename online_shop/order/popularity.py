@@ -0,0 +1,81 @@
+"""
+Ранжирование продуктов по продажам.
+
+Популярность - сумма проданных штук из подтверждённых заказов, где вклад
+заказа затухает вдвое каждые POPULARITY_HALF_LIFE_DAYS. Такую сумму
+можно вести инкрементально: при каждом запуске накопленные очки
+умножаются на коэффициент затухания за прошедшее время, и добавляются
+только заказы, подтверждённые после отметки прошлого запуска (по
+confirmedAt: от оформления до оплаты может пройти сколько угодно). Выпавшие из окна продукты
+(очки ниже POPULARITY_MIN_SCORE) удаляются из таблицы.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from product.cache import bump_generation_on_commit
+from product.models import PopularityState, ProductPopularity
+from .models import OrderItem
+
+CONFIRMED_STATUSES = ("confirmed", "paid")
+
+
+def _decay(age, half_life):
+    return 0.5 ** (age / half_life)
+
+
+def rank_popular_products(now=None):
+    """
+    Учитывает заказы, подтверждённые после прошлого запуска.
+    Возвращает число продуктов, получивших новые продажи.
+    """
+    now = now or timezone.now()
+    # Только что подтверждённые заказы ещё могут быть отменены
+    until = now - timedelta(minutes=settings.POPULARITY_SETTLE_MINUTES)
+    half_life = timedelta(days=settings.POPULARITY_HALF_LIFE_DAYS)
+
+    with transaction.atomic():
+        state, _ = PopularityState.objects.select_for_update().get_or_create(
+            id=1
+        )
+        since = state.processed_until
+        if since is not None and until <= since:
+            return 0
+        if since is None:
+            since = until - timedelta(days=settings.POPULARITY_WINDOW_DAYS)
+        else:
+            ProductPopularity.objects.update(
+                score=F("score") * _decay(until - since, half_life)
+            )
+
+        items = OrderItem.objects.filter(
+            order__status__in=CONFIRMED_STATUSES,
+            order__confirmedAt__gt=since,
+            order__confirmedAt__lte=until,
+        ).values_list("product_id", "count", "order__confirmedAt")
+        added = defaultdict(float)
+        for product_id, count, sold_at in items.iterator():
+            added[product_id] += count * _decay(until - sold_at, half_life)
+
+        ranked = ProductPopularity.objects.in_bulk(list(added))
+        for ranking in ranked.values():
+            ranking.score += added[ranking.pk]
+        ProductPopularity.objects.bulk_update(ranked.values(), ["score"])
+        ProductPopularity.objects.bulk_create(
+            ProductPopularity(product_id=product_id, score=score)
+            for product_id, score in added.items()
+            if product_id not in ranked
+        )
+        ProductPopularity.objects.filter(
+            score__lt=settings.POPULARITY_MIN_SCORE
+        ).delete()
+
+        state.processed_until = until
+        state.save()
+
+    # Кэш популярных продуктов; колонки снимка каталога не меняются
+    bump_generation_on_commit([])
+    return len(added)
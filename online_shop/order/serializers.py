@@ -1,44 +1,20 @@
 from rest_framework import serializers
-from product.serializers import ProductShortSerializer
-from .models import Order, OrderItem, BasketItem
+from .models import Order, OrderItem
+from .snapshots import render_item
 
 
 class OrderProductSerializer(serializers.ModelSerializer):
-    """Сериализатор для продуктов в заказе"""
-
-    price = serializers.DecimalField(
-        source="product.price", max_digits=10, decimal_places=2
-    )
-    count = serializers.IntegerField()
+    """
+    Сериализатор для продуктов в заказе. Выводит снимок продукта,
+    сохранённый при оформлении, а не текущий продукт.
+    """
 
     class Meta:
         model = OrderItem
-        fields = ["product", "count", "price"]
+        fields = ["product", "count", "price", "snapshot"]
 
     def to_representation(self, obj):
-        product_data = ProductShortSerializer(obj.product).data
-        product_data["price"] = obj.product.price
-        product_data["count"] = obj.count
-        return product_data
-
-
-class BasketItemSerializer(serializers.ModelSerializer):
-    """Сериализатор для предмета в корзине"""
-
-    price = serializers.DecimalField(
-        source="product.price", max_digits=10, decimal_places=2
-    )
-    count = serializers.IntegerField()
-
-    class Meta:
-        model = BasketItem
-        fields = ["product", "count", "price"]
-
-    def to_representation(self, obj):
-        product_data = ProductShortSerializer(obj.product).data
-        product_data["price"] = obj.product.price
-        product_data["count"] = obj.count
-        return product_data
+        return render_item(obj)
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -62,3 +38,23 @@ class OrderSerializer(serializers.ModelSerializer):
             "address",
             "products",
         ]
+
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """Сериализатор заказа для истории: без позиций заказа"""
+
+    class Meta:
+        model = Order
+        fields = [
+            "id",
+            "createdAt",
+            "fullName",
+            "email",
+            "phone",
+            "deliveryType",
+            "paymentType",
+            "totalCost",
+            "status",
+            "city",
+            "address",
+        ]
@@ -0,0 +1,63 @@
+"""
+Снимок продукта в позиции заказа.
+
+При оформлении заказа в OrderItem сохраняются цена за штуку и то, что
+нужно истории заказов от продукта: название, описание, категория и
+главное изображение. История заказов строится только по этим данным,
+без обращения к продуктам, акциям и изображениям, и показывает цены на
+момент покупки.
+"""
+from user.models import Image
+from product.models import Product
+
+SNAPSHOT_COLUMNS = ("id", "title", "description", "category_id")
+
+
+def product_snapshots(product_ids):
+    """Снимки продуктов по id: два запроса на любой набор продуктов"""
+    rows = Product.objects.filter(pk__in=product_ids).values_list(
+        *SNAPSHOT_COLUMNS
+    )
+    snapshots = {
+        pk: {
+            "title": title,
+            "description": description,
+            "category": category_id,
+            "image": None,
+        }
+        for pk, title, description, category_id in rows
+    }
+    # Главное изображение - первое по id, как в карточке продукта
+    images = (
+        Product.images.through.objects.filter(product_id__in=snapshots)
+        .order_by("product_id", "image_id")
+        .values_list("product_id", "image__src", "image__alt")
+    )
+    for product_id, src, alt in images:
+        if snapshots[product_id]["image"] is None:
+            snapshots[product_id]["image"] = {"src": src, "alt": alt}
+    return snapshots
+
+
+def render_item(item):
+    """Позиция заказа в формате карточки продукта (с количеством)"""
+    snapshot = item.snapshot or {}
+    image = snapshot.get("image")
+    images = []
+    if image:
+        storage = Image._meta.get_field("src").storage
+        images.append(
+            {
+                "src": storage.url(image["src"]) if image["src"] else None,
+                "alt": image["alt"],
+            }
+        )
+    return {
+        "id": item.product_id,
+        "category": snapshot.get("category"),
+        "title": snapshot.get("title"),
+        "description": snapshot.get("description"),
+        "price": item.price,
+        "count": item.count,
+        "images": images,
+    }
@@ -0,0 +1,117 @@
+"""
+Резервирование товара под заказ.
+
+Остаток продукта уменьшается условным UPDATE ... SET count = count - n
+WHERE count >= n, поэтому проверка и списание атомарны и параллельные
+заказы не продают больше, чем есть на складе. Все позиции заказа
+резервируются в одной транзакции в порядке id продуктов: если хоть одной
+не хватает, откатываются все, а одинаковый порядок блокировок исключает
+взаимоблокировки между заказами с общими продуктами.
+
+Резерв живёт STOCK_RESERVATION_MINUTES: после успешной оплаты он
+подтверждается (commit_reservations), при ошибке оплаты или по истечении
+срока (release_expired_reservations) товар возвращается на склад.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from product.cache import bump_generation_on_commit
+from product.models import Product
+from .models import Order, OrderItem, StockReservation
+
+
+class OutOfStock(Exception):
+    """Продукта на складе меньше, чем нужно заказу"""
+
+    def __init__(self, product_id):
+        super().__init__(f"Not enough stock for product {product_id}")
+        self.product_id = product_id
+
+
+def reserve_order(order, now=None):
+    """
+    Резервирует все позиции заказа или ни одной (OutOfStock).
+    Повторный вызов для заказа с действующим или подтверждённым резервом
+    ничего не делает.
+    """
+    now = now or timezone.now()
+    counts = defaultdict(int)
+    items = OrderItem.objects.filter(order=order).values_list(
+        "product_id", "count"
+    )
+    for product_id, count in items:
+        counts[product_id] += count
+
+    with transaction.atomic():
+        # Блокировка заказа не даёт зарезервировать его дважды
+        Order.objects.select_for_update().filter(pk=order.pk).exists()
+        active = order.reservations.exclude(status=StockReservation.RELEASED)
+        if active.exists():
+            return []
+        for product_id in sorted(counts):
+            updated = Product.objects.filter(
+                pk=product_id, count__gte=counts[product_id]
+            ).update(count=F("count") - counts[product_id])
+            if not updated:
+                raise OutOfStock(product_id)
+        expires_at = now + timedelta(
+            minutes=settings.STOCK_RESERVATION_MINUTES
+        )
+        reservations = StockReservation.objects.bulk_create(
+            StockReservation(
+                order=order,
+                product_id=product_id,
+                count=counts[product_id],
+                expires_at=expires_at,
+            )
+            for product_id in sorted(counts)
+        )
+    # UPDATE мимо save() не вызывает сигналы каталога
+    bump_generation_on_commit(counts)
+    return reservations
+
+
+def commit_reservations(order):
+    """Подтверждает резерв оплаченного заказа, товар уже списан"""
+    return order.reservations.filter(status=StockReservation.HELD).update(
+        status=StockReservation.COMMITTED
+    )
+
+
+def release_reservations(reservations):
+    """Снимает held-резервы из queryset'а и возвращает товар на склад"""
+    with transaction.atomic():
+        held = list(
+            reservations.select_for_update()
+            .filter(status=StockReservation.HELD)
+            .order_by("product_id", "pk")
+        )
+        counts = defaultdict(int)
+        for reservation in held:
+            counts[reservation.product_id] += reservation.count
+        for product_id in sorted(counts):
+            Product.objects.filter(pk=product_id).update(
+                count=F("count") + counts[product_id]
+            )
+        StockReservation.objects.filter(
+            pk__in=[reservation.pk for reservation in held]
+        ).update(status=StockReservation.RELEASED)
+    if counts:
+        bump_generation_on_commit(counts)
+    return len(held)
+
+
+def release_order(order):
+    """Снимает резерв заказа (ошибка или отмена оплаты)"""
+    return release_reservations(order.reservations.all())
+
+
+def release_expired_reservations(now=None):
+    """Снимает резервы, срок которых истёк"""
+    now = now or timezone.now()
+    return release_reservations(
+        StockReservation.objects.filter(expires_at__lt=now)
+    )
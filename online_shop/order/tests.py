@@ -1,8 +1,57 @@
 import logging
-from rest_framework.test import APITestCase
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import Mock
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import (
+    SimpleTestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import (
+    APIRequestFactory,
+    APITestCase,
+    force_authenticate,
+)
 from user.models import User, Image
-from product.models import Category, Product
-from .models import Order, OrderItem
+from product.models import (
+    Category,
+    PopularityState,
+    Product,
+    ProductPopularity,
+)
+from product.serializers import ProductShortSerializer
+from .basket import (
+    JOURNAL_COUNTER_KEY,
+    DatabaseBasketStore,
+    NotEnoughStock,
+    flush_dirty_baskets,
+)
+from .checks import check_basket_store
+from .models import (
+    BasketItem,
+    Order,
+    OrderItem,
+    PaymentOutbox,
+    StockReservation,
+)
+from .outbox import drain_outbox
+from .payment import CircuitBreaker, CircuitOpen, PaymentClient, PaymentError
+from .popularity import rank_popular_products
+from .snapshots import product_snapshots
+from .stock import (
+    OutOfStock,
+    commit_reservations,
+    release_order,
+    reserve_order,
+)
+from .views import PaymentSimulatorView, PaymentView
 
 
 log = logging.getLogger(__name__)
@@ -13,6 +62,8 @@ class BasketViewTest(APITestCase):
         """
         Предустановка пользователя и продуктов для тестирования.
         """
+        # Откат транзакции теста не сбрасывает корзины в кэше
+        cache.clear()
         self.user = User.objects.create_user(
             email="test@mail.com",
             username="testuser",
@@ -94,12 +145,207 @@ class BasketViewTest(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data[0]["count"], 2)
 
+    def test_basket_matches_product_card(self):
+        """
+        Тестирование того, что строка корзины - карточка продукта с
+        количеством в корзине.
+        """
+        response = self.client.post(
+            "/api/basket", {"id": self.product.id, "count": 2}, format="json"
+        )
+        self.product.refresh_from_db()
+        card = ProductShortSerializer(self.product).data
+        card["count"] = 2
+        self.assertEqual(response.data, [card])
+
+    def test_basket_queries_do_not_depend_on_size(self):
+        """
+        Тестирование постоянного числа запросов чтения корзины.
+        """
+        self.client.post(
+            "/api/basket", {"id": self.product.id, "count": 1}, format="json"
+        )
+        with CaptureQueriesContext(connection) as small:
+            self.client.get("/api/basket")
+        for i in range(5):
+            product = Product.objects.create(
+                category=self.category,
+                title=f"Товар {i}",
+                standart_price=10,
+                count=5,
+            )
+            product.images.add(self.image)
+            self.client.post(
+                "/api/basket", {"id": product.id, "count": 1}, format="json"
+            )
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get("/api/basket")
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual(
+            len(large.captured_queries), len(small.captured_queries)
+        )
+
+    @override_settings(BASKET_STORE="order.basket.CachedBasketStore")
+    def test_basket_write_behind(self):
+        """
+        Тестирование отложенной записи корзины в базу.
+        """
+        self.client.post(
+            "/api/basket", {"id": self.product.id, "count": 3}, format="json"
+        )
+        self.assertFalse(BasketItem.objects.exists())
+
+        out = StringIO()
+        call_command("flush_baskets", stdout=out)
+        self.assertIn("Flushed 1 baskets", out.getvalue())
+        item = BasketItem.objects.get()
+        self.assertEqual((item.product_id, item.count), (self.product.id, 3))
+
+        self.client.delete(
+            "/api/basket", {"id": self.product.id, "count": 3}, format="json"
+        )
+        call_command("flush_baskets", stdout=StringIO())
+        self.assertFalse(BasketItem.objects.exists())
+
+    @override_settings(BASKET_STORE="order.basket.CachedBasketStore")
+    def test_flush_after_journal_counter_evicted(self):
+        """
+        Тестирование сброса корзин после вытеснения счётчика журнала.
+        """
+        self.client.post(
+            "/api/basket", {"id": self.product.id, "count": 1}, format="json"
+        )
+        self.assertEqual(flush_dirty_baskets(), 1)
+        # Вытесненный счётчик начинается заново с текущего времени,
+        # отметка сброса остаётся далеко позади
+        cache.incr(JOURNAL_COUNTER_KEY, 10**6)
+        self.client.post(
+            "/api/basket", {"id": self.product.id, "count": 2}, format="json"
+        )
+        self.assertEqual(flush_dirty_baskets(limit=10), 1)
+        self.assertEqual(BasketItem.objects.get().count, 3)
+
+    @override_settings(BASKET_STORE="order.basket.CachedBasketStore")
+    def test_cached_store_needs_shared_cache(self):
+        """
+        Тестирование предупреждения о кэш-хранилище корзин без общего кэша.
+        """
+        self.assertEqual(
+            [error.id for error in check_basket_store(None)], ["order.W001"]
+        )
+        redis = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.redis.RedisCache"
+            }
+        }
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_basket_store(None), [])
+
+    def batch(self, *items):
+        return self.client.post(
+            "/api/basket/batch",
+            {"items": [{"id": pk, "count": count} for pk, count in items]},
+            format="json",
+        )
+
+    def make_products(self, number):
+        products = []
+        for i in range(number):
+            product = Product.objects.create(
+                category=self.category,
+                title=f"Товар {i}",
+                standart_price=10,
+                count=5,
+            )
+            product.images.add(self.image)
+            products.append(product)
+        return products
+
+    def test_basket_batch(self):
+        """
+        Тестирование пакетного изменения корзины.
+        """
+        other = self.make_products(1)[0]
+        self.batch((self.product.id, 2), (other.id, 3))
+        response = self.batch((self.product.id, 1), (other.id, -3))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item["id"], item["count"]) for item in response.data],
+            [(self.product.id, 3)],
+        )
+
+        # Изменение сверх остатка отменяет всю пачку
+        response = self.batch((self.product.id, -1), (other.id, 6))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["id"], other.id)
+        response = self.batch((999999, 1))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get("/api/basket")
+        self.assertEqual(response.data[0]["count"], 3)
+
+        response = self.client.post(
+            "/api/basket/batch", {"items": [{"id": 1}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_basket_batch_queries_do_not_depend_on_size(self):
+        """
+        Тестирование постоянного числа запросов пакетного изменения.
+        """
+        products = self.make_products(6)
+        with CaptureQueriesContext(connection) as small:
+            self.batch((products[0].id, 1))
+        with CaptureQueriesContext(connection) as large:
+            response = self.batch(*((product.id, 2) for product in products))
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual(
+            len(large.captured_queries), len(small.captured_queries)
+        )
+        self.assertEqual(
+            sorted(BasketItem.objects.values_list("count", flat=True)),
+            [2, 2, 2, 2, 2, 3],
+        )
+
+    def test_database_store(self):
+        """
+        Тестирование хранилища корзин без кэша.
+        """
+        response = self.client.post(
+            "/api/basket", {"id": self.product.id, "count": 3}, format="json"
+        )
+        self.assertEqual(response.data[0]["count"], 3)
+        self.assertEqual(BasketItem.objects.get().count, 3)
+        response = self.client.post(
+            "/api/basket", {"id": self.product.id, "count": 8}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(BasketItem.objects.get().count, 3)
+
+        # Добавление - один запрос с проверкой остатка плюс чтение корзины
+        # в той же транзакции (точки сохранения не считаются)
+        store = DatabaseBasketStore()
+        for change in (store.add, store.remove):
+            with CaptureQueriesContext(connection) as ctx:
+                lines = change(self.user.id, self.product.id, 1)
+            statements = [
+                query["sql"]
+                for query in ctx.captured_queries
+                if "SAVEPOINT" not in query["sql"]
+            ]
+            self.assertEqual(len(statements), 2)
+            self.assertEqual(
+                lines, {self.product.id: BasketItem.objects.get().count}
+            )
+        self.assertEqual(BasketItem.objects.get().count, 3)
+
 
 class OrdersViewTest(APITestCase):
     def setUp(self):
         """
         Предустановка пользователя и продуктов для тестирования.
         """
+        # Откат транзакции теста не сбрасывает корзины в кэше
+        cache.clear()
         self.user = User.objects.create_user(
             email="test@mail.com",
             username="testuser",
@@ -182,7 +428,280 @@ class OrdersViewTest(APITestCase):
         order = response.data[0]
         self.assertEqual(order["fullName"], self.user.fullName)
         self.assertEqual(order["email"], self.user.email)
-        self.assertEqual(order["products"][0]["title"], self.product1.title)
+        # Позиции заказа в истории не выводятся
+        self.assertNotIn("products", order)
+
+    def test_get_orders_pages(self):
+        """
+        Тестирование курсорной пагинации истории заказов.
+        """
+        now = timezone.now()
+        orders = []
+        for i in range(5):
+            order = Order.objects.create(
+                user=self.user, totalCost=10 * i, city="", address=""
+            )
+            orders.append(order)
+        # Два заказа с одинаковым временем различаются по id
+        for i, order in enumerate(orders):
+            order.createdAt = now - timedelta(minutes=min(i, 3))
+        Order.objects.bulk_update(orders, ["createdAt"])
+
+        seen = []
+        cursor = ""
+        while cursor is not None:
+            response = self.client.get(
+                "/api/orders", {"cursor": cursor, "limit": 2}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["items"]), 2)
+            seen.extend(order["id"] for order in response.data["items"])
+            cursor = response.data["nextCursor"]
+        expected = [orders[i].id for i in (0, 1, 2, 4, 3)]
+        self.assertEqual(seen, expected)
+
+        response = self.client.get("/api/orders", {"cursor": "broken"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_orders_queries_do_not_depend_on_size(self):
+        """
+        Тестирование постоянного числа запросов списка заказов.
+        """
+        self.client.post(
+            "/api/basket", {"id": self.product1.id, "count": 1}, format="json"
+        )
+        self.client.post("/api/orders", {}, format="json")
+        with CaptureQueriesContext(connection) as small:
+            self.client.get("/api/orders")
+
+        self.client.post(
+            "/api/basket", {"id": self.product2.id, "count": 1}, format="json"
+        )
+        self.client.post("/api/orders", {}, format="json")
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get("/api/orders")
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(
+            len(large.captured_queries), len(small.captured_queries)
+        )
+
+    def test_create_order_queries_do_not_depend_on_size(self):
+        """
+        Тестирование постоянного числа запросов создания заказа.
+        """
+        self.client.post(
+            "/api/basket", {"id": self.product1.id, "count": 1}, format="json"
+        )
+        with CaptureQueriesContext(connection) as small:
+            self.client.post("/api/orders", {}, format="json")
+
+        for i in range(5):
+            product = Product.objects.create(
+                category=self.category,
+                title=f"Товар {i}",
+                standart_price=10,
+                count=5,
+            )
+            self.client.post(
+                "/api/basket", {"id": product.id, "count": 2}, format="json"
+            )
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post("/api/orders", {}, format="json")
+        self.assertEqual(
+            len(large.captured_queries), len(small.captured_queries)
+        )
+        order = Order.objects.get(id=response.data["orderId"])
+        self.assertEqual(order.products.count(), 6)
+        self.assertEqual(order.items.count(), 6)
+        self.assertEqual(order.totalCost, 100 + 5 * 2 * 10)
+
+    def test_order_history_keeps_checkout_price(self):
+        """
+        Тестирование того, что история заказов показывает цену и данные
+        продукта на момент оформления.
+        """
+        self.client.post(
+            "/api/basket", {"id": self.product1.id, "count": 2}, format="json"
+        )
+        response = self.client.post("/api/orders", {}, format="json")
+        order_id = response.data["orderId"]
+        self.product1.title = "Новое название"
+        self.product1.standart_price = 999
+        self.product1.save()
+
+        response = self.client.get(f"/api/order/{order_id}")
+        product = response.data["products"][0]
+        self.assertEqual(product["id"], self.product1.id)
+        self.assertEqual(product["title"], "Монитор")
+        self.assertEqual(product["price"], 100)
+        self.assertEqual(product["count"], 2)
+        self.assertEqual(product["images"][0]["alt"], "картинка")
+
+    def test_backfill_order_items(self):
+        """
+        Тестирование заполнения снимков у старых позиций заказов.
+        """
+        self.client.post(
+            "/api/basket", {"id": self.product1.id, "count": 1}, format="json"
+        )
+        self.client.post("/api/orders", {}, format="json")
+        OrderItem.objects.update(price=None, snapshot={})
+
+        out = StringIO()
+        call_command("backfill_order_items", batch_size=1, stdout=out)
+        self.assertIn("Backfilled 1 order items", out.getvalue())
+        item = OrderItem.objects.get()
+        self.assertEqual(item.price, 100)
+        self.assertEqual(item.snapshot["title"], "Монитор")
+        self.assertEqual(item.snapshot["image"]["src"], "images/test.png")
+
+
+@override_settings(
+    POPULARITY_HALF_LIFE_DAYS=7,
+    POPULARITY_WINDOW_DAYS=90,
+    POPULARITY_SETTLE_MINUTES=60,
+)
+class PopularityTest(APITestCase):
+    def setUp(self):
+        """
+        Предустановка продуктов и подтверждённых заказов.
+        """
+        self.now = timezone.now()
+        self.user = User.objects.create_user(
+            email="test@mail.com",
+            username="testuser",
+            password="testpass",
+            fullName="Test User",
+        )
+        self.category = Category.objects.create(title="Мониторы")
+        self.products = [
+            Product.objects.create(
+                category=self.category,
+                title=f"Монитор {i}",
+                standart_price=100,
+                count=10,
+                rating=5 - i,
+            )
+            for i in range(3)
+        ]
+
+    def order(self, product, count, days_ago, status="confirmed"):
+        order = Order.objects.create(
+            user=self.user,
+            fullName="Test User",
+            email="test@mail.com",
+            phone="123",
+            deliveryType="",
+            paymentType="",
+            totalCost=100,
+            status=status,
+            city="",
+            address="",
+        )
+        created = self.now - timedelta(days=days_ago)
+        Order.objects.filter(pk=order.pk).update(
+            createdAt=created,
+            confirmedAt=created if status == "confirmed" else None,
+        )
+        OrderItem.objects.create(order=order, product=product, count=count)
+
+    def popular_ids(self):
+        response = self.client.get("/api/products/popular")
+        return [item["id"] for item in response.data]
+
+    def test_recent_sales_rank_first(self):
+        """
+        Тестирование ранжирования по продажам с затуханием.
+        """
+        first, second, third = self.products
+        self.order(third, 4, days_ago=1)
+        self.order(second, 10, days_ago=30)
+        self.order(first, 50, days_ago=2, status="canceled")
+        self.assertEqual(rank_popular_products(self.now), 2)
+
+        third.popularity.refresh_from_db()
+        # Возраст заказа считается от отметки "сейчас минус задержка"
+        self.assertAlmostEqual(
+            third.popularity.score, 4 * 0.5 ** ((1 - 1 / 24) / 7), 6
+        )
+        self.assertEqual(self.popular_ids(), [third.id, second.id, first.id])
+
+        # sort_index из админки важнее продаж
+        first.sort_index = -1
+        with self.captureOnCommitCallbacks(execute=True):
+            first.save()
+        self.assertEqual(self.popular_ids()[0], first.id)
+
+    def test_popular_reads_top_of_ranking(self):
+        """
+        Тестирование выдачи популярных: верх рейтинга по индексу, ручной
+        sort_index и добор продуктов без продаж по оценке.
+        """
+        first, second, third = self.products
+        self.assertEqual(self.popular_ids(), [first.id, second.id, third.id])
+
+        cache.clear()
+        ProductPopularity.objects.create(product=third, score=1)
+        Product.objects.filter(pk=first.pk).update(sort_index=1)
+        with CaptureQueriesContext(connection) as ctx:
+            ids = self.popular_ids()
+        self.assertEqual(ids, [third.id, second.id, first.id])
+        # Рейтинг сортируется по своему индексу, без JOIN с каталогом
+        ranking = [
+            query["sql"]
+            for query in ctx.captured_queries
+            if "ORDER BY" in query["sql"] and "score" in query["sql"]
+        ]
+        self.assertEqual(len(ranking), 1)
+        self.assertNotIn("JOIN", ranking[0])
+
+    def test_incremental_run(self):
+        """
+        Тестирование инкрементального запуска: учитываются только новые
+        заказы, а накопленные очки затухают.
+        """
+        first = self.products[0]
+        self.order(first, 8, days_ago=14)
+        rank_popular_products(self.now - timedelta(days=7))
+
+        self.order(first, 2, days_ago=0.5)
+        # Заказ младше задержки подтверждения пока не учитывается
+        self.order(first, 5, days_ago=0.005)
+        self.assertEqual(rank_popular_products(self.now), 1)
+        self.assertEqual(rank_popular_products(self.now), 0)
+
+        settle = 1 / 24
+        expected = 8 * 0.5 ** ((14 - settle) / 7) + 2 * 0.5 ** (
+            (0.5 - settle) / 7
+        )
+        first.popularity.refresh_from_db()
+        self.assertAlmostEqual(first.popularity.score, expected, 6)
+
+        call_command("rank_popular_products", stdout=StringIO())
+        state = PopularityState.objects.get()
+        self.assertGreater(state.processed_until, self.now - timedelta(1))
+
+    def test_late_confirmation_counted(self):
+        """
+        Тестирование учёта заказа, оплаченного позже прошлого запуска, хотя
+        оформлен он был раньше.
+        """
+        first = self.products[0]
+        self.order(first, 3, days_ago=10, status="accepted")
+        self.assertEqual(
+            rank_popular_products(self.now - timedelta(days=7)), 0
+        )
+
+        # Заказ оплачен через 9 дней после оформления
+        order = Order.objects.get()
+        Order.objects.filter(pk=order.pk).update(
+            status="confirmed", confirmedAt=self.now - timedelta(days=1)
+        )
+        self.assertEqual(rank_popular_products(self.now), 1)
+        first.popularity.refresh_from_db()
+        self.assertAlmostEqual(
+            first.popularity.score, 3 * 0.5 ** ((1 - 1 / 24) / 7), 6
+        )
 
 
 class OrderDetailViewTest(APITestCase):
@@ -190,6 +709,8 @@ class OrderDetailViewTest(APITestCase):
         """
         Предустановка пользователя и продуктов для тестирования.
         """
+        # Откат транзакции теста не сбрасывает корзины в кэше
+        cache.clear()
         self.user = User.objects.create_user(
             email="test@mail.com",
             username="testuser",
@@ -231,6 +752,8 @@ class OrderDetailViewTest(APITestCase):
             order=self.order,
             product=self.product,
             count=2,
+            price=self.product.price,
+            snapshot=product_snapshots([self.product.id])[self.product.id],
         )
         self.order.products.add(self.basket_item)
 
@@ -258,6 +781,28 @@ class OrderDetailViewTest(APITestCase):
         self.assertEqual(response.status_code, 404)
         self.assertIn("error", response.data)
 
+    def test_order_detail_queries_do_not_depend_on_size(self):
+        """
+        Тестирование постоянного числа запросов деталей заказа.
+        """
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(f"/api/order/{self.order.id}")
+        for i in range(3):
+            item = OrderItem.objects.create(
+                order=self.order,
+                product=self.product,
+                count=1,
+                price=self.product.price,
+                snapshot=product_snapshots([self.product.id])[self.product.id],
+            )
+            self.order.products.add(item)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(f"/api/order/{self.order.id}")
+        self.assertEqual(len(response.data["products"]), 4)
+        self.assertEqual(
+            len(large.captured_queries), len(small.captured_queries)
+        )
+
     def test_confirm_order_not_found(self):
         """
         Тестирование подтверждения несуществующего заказа.
@@ -267,81 +812,420 @@ class OrderDetailViewTest(APITestCase):
         self.assertIn("error", response.data)
 
 
-# Отключено, так как подключён внешний платёжный шлюз
-
-# class PaymentViewTest(APITestCase):
-#     payment_data = {
-#         "number": "12345678",
-#         "name": "Test User",
-#         "month": "02",
-#         "year": "2025",
-#         "code": "123",
-#     }
-
-#     def setUp(self):
-#         """
-#         Предустановка пользователя и продуктов для тестирования.
-#         """
-#         self.user = User.objects.create_user(
-#             email="test@mail.com",
-#             username="testuser",
-#             password="testpass",
-#             fullName="Test User",
-#         )
-#         self.image = Image.objects.create(
-#             src="images/test.png", alt="Test Image"
-#         )
-#         self.category = Category.objects.create(
-#             title="Мониторы", image=self.image
-#         )
-#         self.product = Product.objects.create(
-#             category=self.category,
-#             title="Монитор",
-#             standart_price=100.00,
-#             count=5,
-#             description="desc",
-#             fullDescription="full",
-#             freeDelivery=True,
-#             rating=4.5,
-#         )
-#         self.client.force_authenticate(user=self.user)
-
-#         self.product.images.add(self.image)
-#         self.basket_item = BasketItem.objects.create(
-#             user=self.user, product=self.product, count=2
-#         )
-#         self.order = Order.objects.create(
-#             user=self.user,
-#             fullName=self.user.fullName,
-#             email=self.user.email,
-#             phone="1234567890",
-#             deliveryType="free",
-#             paymentType="online",
-#             totalCost=self.product.price * 2,
-#             status="accepted",
-#             city="Moscow",
-#             address="Red Square 1",
-#         )
-#         self.order.products.add(self.basket_item)
-
-#     def test_payment_success(self):
-#         """
-#         Тестирование успешного платежа.
-#         """
-#         response = self.client.post(
-#             f"/api/payment/{self.order.id}", self.payment_data, format="json"
-#         )
-#         self.assertEqual(response.status_code, 200)
-#         self.assertIn("message", response.data)
-#         self.order.refresh_from_db()
-#         self.assertEqual(self.order.status, "paid")
-
-#     def test_payment_order_not_found(self):
-#         """
-#         Тестирование получения заказа, которого не существует.
-#         """
-#         response = self.client.post(
-#             "/api/payment/9999999", self.payment_data, format="json"
-#         )
-#         self.assertEqual(response.status_code, 404)
-#         self.assertIn("error", response.data)
+class StockReservationTest(APITestCase):
+    def setUp(self):
+        """
+        Предустановка заказа на 2 монитора и 1 клавиатуру.
+        """
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="test@mail.com",
+            username="testuser",
+            password="testpass",
+            fullName="Test User",
+        )
+        self.category = Category.objects.create(title="Мониторы")
+        self.monitor = Product.objects.create(
+            category=self.category,
+            title="Монитор",
+            standart_price=100,
+            count=3,
+        )
+        self.keyboard = Product.objects.create(
+            category=self.category, title="Клава", standart_price=50, count=1
+        )
+        self.order = self.make_order((self.monitor, 2), (self.keyboard, 1))
+        self.client.force_authenticate(user=self.user)
+
+    def make_order(self, *lines):
+        order = Order.objects.create(
+            user=self.user,
+            fullName="Test User",
+            email="test@mail.com",
+            phone="",
+            deliveryType="",
+            paymentType="",
+            totalCost=0,
+            city="",
+            address="",
+        )
+        for product, count in lines:
+            OrderItem.objects.create(order=order, product=product, count=count)
+        return order
+
+    def stock(self):
+        self.monitor.refresh_from_db()
+        self.keyboard.refresh_from_db()
+        return self.monitor.count, self.keyboard.count
+
+    def test_reserve_all_or_nothing(self):
+        """
+        Тестирование того, что заказ резервируется целиком или никак.
+        """
+        reserve_order(self.order)
+        self.assertEqual(self.stock(), (1, 0))
+        # Повторный вызов не резервирует второй раз
+        reserve_order(self.order)
+        self.assertEqual(self.stock(), (1, 0))
+
+        other = self.make_order((self.monitor, 1), (self.keyboard, 1))
+        with self.assertRaises(OutOfStock) as ctx:
+            reserve_order(other)
+        self.assertEqual(ctx.exception.product_id, self.keyboard.id)
+        self.assertEqual(self.stock(), (1, 0))
+        self.assertFalse(other.reservations.exists())
+
+    def test_release_and_commit(self):
+        """
+        Тестирование возврата товара при снятии резерва.
+        """
+        reserve_order(self.order)
+        self.assertEqual(release_order(self.order), 2)
+        self.assertEqual(self.stock(), (3, 1))
+        # Снятый резерв не возвращает товар второй раз
+        self.assertEqual(release_order(self.order), 0)
+
+        reserve_order(self.order)
+        commit_reservations(self.order)
+        self.assertEqual(release_order(self.order), 0)
+        self.assertEqual(self.stock(), (1, 0))
+
+    def test_release_expired(self):
+        """
+        Тестирование снятия просроченных резервов командой.
+        """
+        reserve_order(self.order, now=timezone.now() - timedelta(hours=1))
+        out = StringIO()
+        call_command("release_expired_reservations", stdout=out)
+        self.assertIn("Released 2 reservations", out.getvalue())
+        self.assertEqual(self.stock(), (3, 1))
+
+    def payment_response(self, status_code, data=None):
+        response = Mock(status_code=status_code, text="")
+        response.json.return_value = data or {}
+        session = Mock()
+        session.post.return_value = response
+        return session
+
+    def test_checkout_does_not_call_payment_service(self):
+        """
+        Тестирование того, что оформление только ставит оплату в очередь.
+        """
+        response = self.client.post(f"/api/order/{self.order.id}")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status"], PaymentOutbox.PENDING)
+        self.assertEqual(self.stock(), (1, 0))
+
+        # Повторное подтверждение не создаёт второй платёж
+        self.client.post(f"/api/order/{self.order.id}")
+        self.assertEqual(self.order.payments.count(), 1)
+        response = self.client.get(f"/api/order/{self.order.id}/payment")
+        self.assertEqual(response.data["status"], PaymentOutbox.PENDING)
+        self.assertIsNone(response.data["confirmation_url"])
+
+    def test_payment_success_commits_stock(self):
+        """
+        Тестирование списания товара после подтверждения оплаты.
+        """
+        self.client.post(f"/api/order/{self.order.id}")
+        session = self.payment_response(
+            201, {"confirmation_url": "http://pay"}
+        )
+        self.assertEqual(drain_outbox(PaymentClient(session), workers=1), 1)
+
+        payment = self.order.payments.get()
+        kwargs = session.post.call_args.kwargs
+        self.assertEqual(
+            kwargs["headers"]["Idempotence-Key"], str(payment.key)
+        )
+        self.assertEqual(kwargs["json"]["order_id"], self.order.id)
+        self.assertIn("timeout", kwargs)
+
+        response = self.client.get(f"/api/order/{self.order.id}/payment")
+        self.assertEqual(response.data["status"], PaymentOutbox.SENT)
+        self.assertEqual(response.data["confirmation_url"], "http://pay")
+        self.assertEqual(self.stock(), (1, 0))
+        self.assertEqual(
+            set(self.order.reservations.values_list("status", flat=True)),
+            {StockReservation.COMMITTED},
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "confirmed")
+        self.assertIsNotNone(self.order.confirmedAt)
+
+    @override_settings(PAYMENT_MAX_ATTEMPTS=2)
+    def test_payment_failure_retries_then_releases_stock(self):
+        """
+        Тестирование повтора с задержкой и возврата товара на склад,
+        когда попытки закончились.
+        """
+        self.client.post(f"/api/order/{self.order.id}")
+        session = Mock()
+        session.post.side_effect = requests.ConnectionError("down")
+
+        drain_outbox(PaymentClient(session), workers=1)
+        payment = self.order.payments.get()
+        self.assertEqual(payment.status, PaymentOutbox.PENDING)
+        self.assertEqual(payment.attempts, 1)
+        self.assertGreater(payment.next_attempt_at, timezone.now())
+        # До истечения задержки запрос не берётся снова
+        self.assertEqual(drain_outbox(PaymentClient(session), workers=1), 0)
+        self.assertEqual(self.stock(), (1, 0))
+
+        PaymentOutbox.objects.update(next_attempt_at=timezone.now())
+        drain_outbox(PaymentClient(session), workers=1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, PaymentOutbox.FAILED)
+        self.assertEqual(self.stock(), (3, 1))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "canceled")
+        response = self.client.get(f"/api/order/{self.order.id}/payment")
+        self.assertIn("down", response.data["error"])
+
+    def test_payment_rejected_without_retry(self):
+        """
+        Тестирование того, что отказ платёжного сервиса не повторяется.
+        """
+        self.client.post(f"/api/order/{self.order.id}")
+        drain_outbox(PaymentClient(self.payment_response(400)), workers=1)
+        payment = self.order.payments.get()
+        self.assertEqual(payment.status, PaymentOutbox.FAILED)
+        self.assertEqual(payment.attempts, 1)
+        self.assertEqual(self.stock(), (3, 1))
+
+    def test_open_circuit_does_not_spend_attempts(self):
+        """
+        Тестирование того, что при разомкнутом автомате запрос не
+        отправляется и попытка не засчитывается.
+        """
+        self.client.post(f"/api/order/{self.order.id}")
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        session = Mock()
+        drain_outbox(PaymentClient(session, breaker), workers=1)
+        session.post.assert_not_called()
+        payment = self.order.payments.get()
+        self.assertEqual(payment.status, PaymentOutbox.PENDING)
+        self.assertEqual(payment.attempts, 0)
+        self.assertGreater(payment.next_attempt_at, timezone.now())
+
+
+class StockConcurrencyTest(TransactionTestCase):
+    def test_no_oversell_under_concurrency(self):
+        """
+        Тестирование того, что параллельные заказы не продают больше,
+        чем есть на складе.
+        """
+        user = User.objects.create_user(
+            email="test@mail.com", username="testuser", password="testpass"
+        )
+        category = Category.objects.create(title="Мониторы")
+        product = Product.objects.create(
+            category=category, title="Монитор", standart_price=100, count=5
+        )
+        orders = []
+        for _ in range(20):
+            order = Order.objects.create(
+                user=user,
+                fullName="",
+                email="test@mail.com",
+                phone="",
+                deliveryType="",
+                paymentType="",
+                totalCost=0,
+                city="",
+                address="",
+            )
+            OrderItem.objects.create(order=order, product=product, count=1)
+            orders.append(order)
+
+        def checkout(order):
+            try:
+                reserve_order(order)
+                return True
+            except (OutOfStock, OperationalError):
+                # SQLite может отказать в записи при конкуренции
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            reserved = sum(pool.map(checkout, orders))
+
+        product.refresh_from_db()
+        self.assertGreater(reserved, 0)
+        self.assertEqual(product.count, 5 - reserved)
+        self.assertEqual(
+            StockReservation.objects.filter(product=product).count(), reserved
+        )
+
+    def test_concurrent_basket_adds(self):
+        """
+        Тестирование того, что параллельные добавления в корзину не
+        создают дублей строк, не теряют штуки и не превышают остаток.
+        """
+        user = User.objects.create_user(
+            email="test@mail.com", username="testuser", password="testpass"
+        )
+        category = Category.objects.create(title="Мониторы")
+        product = Product.objects.create(
+            category=category, title="Монитор", standart_price=100, count=5
+        )
+        store = DatabaseBasketStore()
+        # Проверяется только сам запрос добавления: чтение корзины после
+        # него в SQLite может упасть с блокировкой уже после коммита
+        store.lines = lambda user_id: {}
+
+        def add(_):
+            try:
+                store.add(user.id, product.id, 1)
+                return True
+            except (NotEnoughStock, OperationalError):
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            added = sum(pool.map(add, range(10)))
+
+        item = BasketItem.objects.get(user=user)
+        self.assertGreater(added, 0)
+        self.assertEqual(item.count, added)
+        self.assertLessEqual(item.count, 5)
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        self.now = 0
+        self.breaker = CircuitBreaker(
+            failure_threshold=2, reset_timeout=10, clock=lambda: self.now
+        )
+
+    def test_opens_after_failures(self):
+        """
+        Тестирование размыкания после ошибок подряд и пробного запроса.
+        """
+        self.breaker.record_failure()
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+
+        # После паузы проходит один пробный запрос
+        self.now = 11
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+        self.breaker.record_success()
+        self.breaker.before_call()
+
+    def test_failed_probe_opens_again(self):
+        """
+        Тестирование повторного размыкания при ошибке пробного запроса.
+        """
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now = 11
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpen) as ctx:
+            self.breaker.before_call()
+        self.assertEqual(ctx.exception.retry_after, 10)
+
+    def test_client_counts_server_errors(self):
+        """
+        Тестирование того, что клиент считает ошибками только сбои
+        соединения и 5xx, а не отказы 4xx.
+        """
+        session = Mock()
+        session.post.return_value = Mock(status_code=400, text="")
+        client = PaymentClient(session, self.breaker)
+        for _ in range(3):
+            with self.assertRaises(PaymentError) as ctx:
+                client.create_payment({}, "key")
+            self.assertFalse(ctx.exception.retry)
+
+        session.post.side_effect = requests.ConnectTimeout("timeout")
+        for _ in range(2):
+            with self.assertRaises(PaymentError):
+                client.create_payment({}, "key")
+        with self.assertRaises(CircuitOpen):
+            client.create_payment({}, "key")
+        self.assertEqual(session.post.call_count, 5)
+
+
+@override_settings(PAYMENT_SIMULATOR_LATENCY=0)
+class PaymentSimulatorTest(APITestCase):
+    def setUp(self):
+        """
+        Предустановка заказа для оплаты через эмулятор.
+        """
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(
+            email="test@mail.com", username="testuser", password="testpass"
+        )
+        self.order = Order.objects.create(
+            user=self.user,
+            fullName="Test User",
+            email="test@mail.com",
+            phone="",
+            deliveryType="",
+            paymentType="",
+            totalCost=100,
+            status="confirmed",
+            city="",
+            address="",
+        )
+
+    def create_payment(self, key):
+        request = self.factory.post(
+            "/api/payment-simulator",
+            {"amount": {"value": "100"}, "order_id": self.order.id},
+            format="json",
+            headers={"Idempotence-Key": key},
+        )
+        return PaymentSimulatorView.as_view()(request)
+
+    def test_simulator_is_idempotent(self):
+        """
+        Тестирование того, что повтор с тем же ключом даёт тот же платёж.
+        """
+        first = self.create_payment("key-1")
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(
+            first.data["confirmation_url"].endswith(
+                f"/payment/{self.order.id}/"
+            )
+        )
+        self.assertEqual(self.create_payment("key-1").data, first.data)
+        self.assertNotEqual(
+            self.create_payment("key-2").data["id"], first.data["id"]
+        )
+
+    @override_settings(PAYMENT_SIMULATOR_ERROR_RATE=1)
+    def test_simulator_errors(self):
+        """
+        Тестирование эмуляции сбоев платёжного сервиса.
+        """
+        self.assertEqual(self.create_payment("key").status_code, 503)
+
+    def pay(self, number):
+        request = self.factory.post(
+            f"/api/payment/{self.order.id}", {"number": number}, format="json"
+        )
+        force_authenticate(request, user=self.user)
+        return PaymentView.as_view()(request, id=self.order.id)
+
+    def test_card_payment(self):
+        """
+        Тестирование оплаты картой на странице эмулятора.
+        """
+        self.assertEqual(self.pay("12345671").status_code, 400)
+        self.assertEqual(self.pay("12345670").status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "confirmed")
+
+        self.assertEqual(self.pay("12345678").status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "paid")
+        self.assertIsNotNone(self.order.confirmedAt)
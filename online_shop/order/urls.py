@@ -1,15 +1,27 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     BasketView,
+    BasketBatchView,
     OrdersView,
     OrderDetailView,
-    # PaymentView,
+    OrderPaymentView,
+    PaymentSimulatorView,
+    PaymentView,
 )
 
 
 urlpatterns = [
     path("basket", BasketView.as_view()),
+    path("basket/batch", BasketBatchView.as_view()),
     path("orders", OrdersView.as_view()),
     path("order/<int:id>", OrderDetailView.as_view()),
-    # path("payment/<int:id>", PaymentView.as_view()),
+    path("order/<int:id>/payment", OrderPaymentView.as_view()),
 ]
+
+# Эмулятор платёжного сервиса и его страница оплаты картой
+if settings.PAYMENT_SIMULATOR:
+    urlpatterns += [
+        path("payment-simulator", PaymentSimulatorView.as_view()),
+        path("payment/<int:id>", PaymentView.as_view()),
+    ]
@@ -1,31 +1,60 @@
 import logging
 import random
-import requests
-from product.models import Product
-from online_shop.settings import PAYMENT_URL
+import time
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from product.pagination import InvalidCursor, keyset_page
+from online_shop.queryplan import plan_queryset
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.status import (
     HTTP_404_NOT_FOUND,
     HTTP_400_BAD_REQUEST,
     HTTP_200_OK,
-    HTTP_201_CREATED,
+    HTTP_202_ACCEPTED,
+    HTTP_503_SERVICE_UNAVAILABLE,
 )
 from .models import (
     BasketItem,
     Order,
     DeliverySettings,
     OrderItem,
+    PaymentOutbox,
 )
 from .serializers import (
     OrderSerializer,
-    BasketItemSerializer,
+    OrderSummarySerializer,
+)
+from .basket import (
+    NotEnoughStock,
+    NotInBasket,
+    ProductNotFound,
+    basket_cards,
+    get_basket_store,
+)
+from .outbox import enqueue_payment, payment_status
+from .snapshots import product_snapshots
+from .stock import (
+    OutOfStock,
+    reserve_order,
 )
 
 
 log = logging.getLogger(__name__)
 
 
+def _product_id(data):
+    """id продукта из тела запроса или None"""
+    try:
+        return int(data.get("id"))
+    except (TypeError, ValueError):
+        return None
+
+
 class BasketView(APIView):
     """Вьюха для корзины пользователя"""
 
@@ -39,60 +68,50 @@ class BasketView(APIView):
                 {"message": "User is anonymous, no basket available"},
                 HTTP_404_NOT_FOUND,
             )
-        items = BasketItem.objects.filter(user=user)
-        serializer = BasketItemSerializer(items, many=True)
-        return Response(serializer.data)
+        lines = get_basket_store().lines(user.id)
+        return Response(basket_cards(lines))
 
     def post(self, request):
         """Добавление товара в корзину"""
         user = request.user
-        product_id = request.data.get("id")
+        product_id = _product_id(request.data)
         count = int(request.data.get("count", 1))
 
-        # Проверяю, что товар существует
-        product = Product.objects.filter(id=product_id).first()
-        if not product:
+        # Добавляю товар, если он есть и на складе его достаточно
+        try:
+            lines = get_basket_store().add(user.id, product_id, count)
+        except ProductNotFound:
             log.warning(
-                "User %d tried to add non-existent product %d to basket",
+                "User %d tried to add non-existent product %s to basket",
                 user.id, product_id
-                )
+            )
             return Response(
                 {"message": "Product not found"}, HTTP_404_NOT_FOUND
             )
-        # Создаю новую или обновляю старую позицию в корзине
-        item, _ = BasketItem.objects.get_or_create(user=user, product=product)
-        item.count += count
-
-        # Проверяю, что на складе достаточно товара
-        if product.count < item.count:
+        except NotEnoughStock:
             log.warning(
-                "User %d tried to add %d of product %d, but only %d in stock",
-                user.id, count, product_id, product.count
+                "User %d tried to add %d of product %d, not enough in stock",
+                user.id, count, product_id
             )
             return Response(
                 {"error": "Not enough products in stock"}, HTTP_400_BAD_REQUEST
             )
-        item.save()
 
         # Возвращаю обновлённую корзину
-        items = BasketItem.objects.filter(user=user)
-        serializer = BasketItemSerializer(items, many=True)
-        return Response(serializer.data)
+        return Response(basket_cards(lines))
 
     def delete(self, request):
         """Удаление товара из корзины"""
         user = request.user
-        product_id = request.data.get("id")
+        product_id = _product_id(request.data)
         count = int(request.data.get("count", 1))
 
-        item = BasketItem.objects.filter(
-            user=user, product_id=product_id
-        ).first()
-
-        # Проверяю, что товар существует
-        if not item:
+        # Удаляю товар или уменьшаю его количество
+        try:
+            lines = get_basket_store().remove(user.id, product_id, count)
+        except NotInBasket:
             log.warning(
-                "User %d tried to delete product %d not in basket",
+                "User %d tried to delete product %s not in basket",
                 user.id, product_id
             )
             return Response(
@@ -100,29 +119,102 @@ class BasketView(APIView):
                 HTTP_404_NOT_FOUND,
             )
 
-        # Удаляю товар или уменьшаю его количество
-        if item:
-            if count >= item.count:
-                item.delete()
-            else:
-                item.count -= count
-                item.save()
-
         # Возвращаю обновлённую корзину
-        items = BasketItem.objects.filter(user=user)
-        serializer = BasketItemSerializer(items, many=True)
-        return Response(serializer.data)
+        return Response(basket_cards(lines))
+
+
+class BasketBatchView(APIView):
+    """Вьюха для пакетного изменения корзины"""
+
+    def post(self, request):
+        """
+        Применяет список изменений [{id, count}] одной транзакцией:
+        count > 0 добавляет товар, count < 0 убирает. Если хоть одно
+        изменение невозможно, корзина не меняется.
+        """
+        user = request.user
+        if not user.is_authenticated:
+            log.warning("Anonymous user tried to change basket")
+            return Response(
+                {"message": "User is anonymous, no basket available"},
+                HTTP_404_NOT_FOUND,
+            )
+        items = request.data.get("items")
+        deltas = {}
+        try:
+            for item in items:
+                product_id = int(item["id"])
+                deltas[product_id] = deltas.get(product_id, 0) + int(
+                    item["count"]
+                )
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {"error": "items must be a list of {id, count}"},
+                HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            lines = get_basket_store().apply(user.id, deltas)
+        except ProductNotFound as e:
+            log.warning(
+                "User %d tried to add non-existent product %d to basket",
+                user.id, e.product_id
+            )
+            return Response(
+                {"message": f'Product "{e.product_id}" not found'},
+                HTTP_404_NOT_FOUND,
+            )
+        except NotEnoughStock as e:
+            log.warning(
+                "User %d basket batch exceeds stock of product %d",
+                user.id, e.product_id
+            )
+            return Response(
+                {
+                    "error": "Not enough products in stock",
+                    "id": e.product_id,
+                },
+                HTTP_400_BAD_REQUEST,
+            )
+        return Response(basket_cards(lines))
 
 
 class OrdersView(APIView):
     """Вьюха для заказов пользователя"""
 
     def get(self, request):
-        """Получение всех заказов по пользователю"""
-        user = request.user
-        orders = Order.objects.filter(user=user)
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        """
+        История заказов пользователя (новые первыми) без позиций заказа,
+        позиции отдаёт OrderDetailView
+        """
+        orders = plan_queryset(
+            Order.objects.filter(user=request.user), OrderSummarySerializer
+        )
+        # Курсорная пагинация: включается параметром cursor (пустой - первая
+        # страница), идёт по индексу (user, createdAt, id)
+        cursor = request.query_params.get("cursor")
+        if cursor is None:
+            orders = orders.order_by("-createdAt", "-id")
+            return Response(OrderSummarySerializer(orders, many=True).data)
+
+        limit = min(
+            int(
+                request.query_params.get("limit", settings.ORDERS_PAGE_LIMIT)
+            ),
+            settings.ORDERS_PAGE_MAX_LIMIT,
+        )
+        try:
+            items, next_cursor = keyset_page(
+                orders, "createdAt", True, cursor, limit
+            )
+        except InvalidCursor as e:
+            log.warning(f"Orders cursor rejected: {e}")
+            return Response({"error": "Invalid cursor"}, HTTP_400_BAD_REQUEST)
+        data = {
+            "items": OrderSummarySerializer(items, many=True).data,
+            "nextCursor": next_cursor,
+        }
+        return Response(data, HTTP_200_OK)
 
     def post(self, request):
         """Создание заказа на основе корзины"""
@@ -133,41 +225,51 @@ class OrdersView(APIView):
         fullName = getattr(user, "fullName", "")
         email = getattr(user, "email", "")
         phone = getattr(user, "phone", "")
-        totalCost = 0
-
-        # Считаю стоимость товаров в корзине
-        basket_items = list(BasketItem.objects.filter(user=user))
-        order_items = []
-
-        for item in basket_items:
-            product = item.product
-            count = item.count
-            if product:
-                totalCost += product.price * count
-
-        # Создаю заказ
-        order = Order.objects.create(
-            user=user,
-            fullName=fullName,
-            email=email,
-            phone=phone,
-            deliveryType="",
-            paymentType="",
-            totalCost=totalCost,
-            city="",
-            address="",
+
+        # Корзина из кэша сразу сбрасывается в базу
+        get_basket_store().flush(user.id)
+
+        # Позиции корзины с ценами продуктов - одним запросом
+        basket_items = list(
+            BasketItem.objects.filter(user=user)
+            .order_by("pk")
+            .values_list("product_id", "count", "product__effective_price")
+        )
+        totalCost = sum(
+            (price * count for _, count, price in basket_items), Decimal(0)
         )
-        # Копирую BasketItems в OrderItems и создаю заказ
-        for item in basket_items:
-            order_item = OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                count=item.count
-            )
-            order_items.append(order_item)
 
-        order.products.set(order_items)
-        order.save()
+        # Заказ и его позиции создаются целиком или не создаются вовсе
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=user,
+                fullName=fullName,
+                email=email,
+                phone=phone,
+                deliveryType="",
+                paymentType="",
+                totalCost=totalCost,
+                city="",
+                address="",
+            )
+            # Копирую BasketItems в OrderItems пакетными INSERT
+            snapshots = product_snapshots(
+                [product_id for product_id, _, _ in basket_items]
+            )
+            order_items = OrderItem.objects.bulk_create(
+                OrderItem(
+                    order=order,
+                    product_id=product_id,
+                    count=count,
+                    price=price,
+                    snapshot=snapshots[product_id],
+                )
+                for product_id, count, price in basket_items
+            )
+            Order.products.through.objects.bulk_create(
+                Order.products.through(order=order, orderitem=item)
+                for item in order_items
+            )
         log.info(
             "Order %d created for user %d with total price %d",
             order.id, user.id, totalCost
@@ -180,7 +282,9 @@ class OrderDetailView(APIView):
 
     def get(self, request, id):
         """Получение деталей заказа по id"""
-        order = Order.objects.filter(id=id, user=request.user).first()
+        order = plan_queryset(
+            Order.objects.filter(id=id, user=request.user), OrderSerializer
+        ).first()
         if not order:
             return Response({"error": "Order not found"}, HTTP_404_NOT_FOUND)
         serializer = OrderSerializer(order)
@@ -192,23 +296,6 @@ class OrderDetailView(APIView):
         if not order:
             return Response({"error": "Order not found"}, HTTP_404_NOT_FOUND)
 
-        # Проверяю наличие товаров в магазине
-        for order_item in order.products.all():
-            product = order_item.product
-            if product.count < order_item.count:
-                order.status = "canceled"
-                order.save()
-                log.warning(
-                    "Order %d canceled: not enough stock for product %d",
-                    order.id, product.id
-                )
-                return Response(
-                    {
-                        "error": f'Not enough stock for product "{product.id}"'
-                    },
-                    HTTP_400_BAD_REQUEST,
-                )
-
         # Обновляю данные по заказу
         order.deliveryType = request.data.get("deliveryType", "ordinary")
         order.fullName = request.data.get("fullName", order.fullName)
@@ -218,73 +305,109 @@ class OrderDetailView(APIView):
         order.address = request.data.get("address", order.address)
 
         # Считаю итоговую стоимость с учётом доставки
-        settings, _ = DeliverySettings.objects.get_or_create(id=1)
+        delivery, _ = DeliverySettings.objects.get_or_create(id=1)
         delivery_cost = (
-            settings.express_cost
+            delivery.express_cost
             if order.deliveryType == "express"
-            else settings.regular_cost
+            else delivery.regular_cost
         )
-        if order.totalCost >= settings.free_from:
+        if order.totalCost >= delivery.free_from:
             delivery_cost = 0
         totalCostWithDelivery = order.totalCost + delivery_cost
 
-        # Провожу оплату
+        # Резервирую товар и ставлю оплату в очередь одной транзакцией,
+        # сам платёжный сервис вызывает воркер drain_payment_outbox
         try:
-            amount = {"value": str(totalCostWithDelivery), "currency": "RUB"}
-            user_id = str(request.user.id)
-            order_id = order.id
-            response = requests.post(
-                PAYMENT_URL,
-                json={
-                    "amount": amount,
-                    "user_id": user_id,
-                    "order_id": order_id,
-                },
+            with transaction.atomic():
+                reserve_order(order)
+                order.save()
+                payment = enqueue_payment(order, totalCostWithDelivery)
+        except OutOfStock as e:
+            Order.objects.filter(pk=order.pk).update(status="canceled")
+            log.warning(
+                "Order %d canceled: not enough stock for product %d",
+                order.id, e.product_id
             )
-            # Перенаправляю пользователя на оплату
-            if response.status_code not in [200, 201, 202, 204]:
-                raise requests.RequestException(f"Error: {response.text}")
-
-            payment_url = response.json().get("confirmation_url")
-            if not payment_url:
-                raise requests.RequestException(
-                    "No confirmation_url in response"
-                )
-            order.status = "confirmed"
-            log.info(f"Order {order.id} payment confirmed for user {user_id}")
-
-        except requests.RequestException as e:
-            order.status = "canceled"
-            log.error(f"Payment service error for order {order.id}: {e}")
             return Response(
-                {"error": "Payment service is unavailable"},
+                {"error": f'Not enough stock for product "{e.product_id}"'},
                 HTTP_400_BAD_REQUEST,
             )
+        log.info(f"Order {order.id} payment queued for user {order.user_id}")
 
-        # После подтверждения заказа убираю товары со склада
-        if order.status == "confirmed":
-            log.info(
-                f"Order {order.id} confirmed. Deducting products from stock."
+        # Ссылку на оплату фронт получает из /api/order/<id>/payment
+        return Response(payment_status(payment), HTTP_202_ACCEPTED)
+
+
+class OrderPaymentView(APIView):
+    """Вьюха состояния оплаты заказа"""
+
+    def get(self, request, id):
+        """Состояние последнего запроса на оплату и ссылка на оплату"""
+        payment = (
+            PaymentOutbox.objects.filter(
+                order_id=id, order__user=request.user
             )
-            for order_item in order.products.all():
-                product = order_item.product
-                product.count = max(product.count - order_item.count, 0)
-                product.save()
-                log.info(
-                    "Product %d stock updated: %d left after order %d",
-                    product.id, product.count, order.id
-                )
-        order.save()
+            .order_by("-pk")
+            .first()
+        )
+        if not payment:
+            return Response(
+                {"error": "Payment not found"}, HTTP_404_NOT_FOUND
+            )
+        return Response(payment_status(payment), HTTP_200_OK)
+
+
+PAYMENT_ERRORS = [
+    "Payment declined by bank.",
+    "Insufficient funds.",
+    "Card expired.",
+    "Technical error. Try again later.",
+]
+
+
+# Эмулятор платёжной системы, подключается при PAYMENT_SIMULATOR=True
+class PaymentSimulatorView(APIView):
+    """
+    Эмулятор API платёжного сервиса с настраиваемыми задержкой
+    (PAYMENT_SIMULATOR_LATENCY) и долей ошибок
+    (PAYMENT_SIMULATOR_ERROR_RATE) для нагрузочного тестирования
+    оформления заказов без внешнего сервиса.
+    """
 
-        # Очищаю корзину
-        BasketItem.objects.filter(user=request.user).delete()
+    authentication_classes = []
 
-        return Response({"confirmation_url": payment_url}, HTTP_201_CREATED)
+    def post(self, request):
+        """Создание платежа: ссылка на страницу оплаты картой"""
+        time.sleep(settings.PAYMENT_SIMULATOR_LATENCY)
+        if random.random() < settings.PAYMENT_SIMULATOR_ERROR_RATE:
+            return Response(
+                {"error": random.choice(PAYMENT_ERRORS)},
+                HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        order_id = request.data.get("order_id")
+        if not isinstance(order_id, int) or "amount" not in request.data:
+            return Response(
+                {"error": "order_id and amount are required"},
+                HTTP_400_BAD_REQUEST,
+            )
+        # Повтор с тем же ключом возвращает тот же платёж
+        key = request.headers.get("Idempotence-Key") or str(uuid.uuid4())
+        payment = cache.get_or_set(
+            f"payment-simulator:{key}",
+            {
+                "id": key,
+                "status": "pending",
+                "confirmation_url": request.build_absolute_uri(
+                    f"/payment/{order_id}/"
+                ),
+            },
+            timeout=60 * 60 * 24,
+        )
+        return Response(payment, HTTP_200_OK)
 
 
-# Не используется, так как подключён платёжный сервис
 class PaymentView(APIView):
-    """Вьюха для эмуляции платёжной системы"""
+    """Вьюха для эмуляции оплаты картой (страница оплаты эмулятора)"""
 
     def post(self, request, id):
         """Обработка платежа по заказу"""
@@ -294,29 +417,20 @@ class PaymentView(APIView):
 
         number = str(request.data.get("number", ""))
         if not number.isdigit() or len(number) > 8 or int(number) % 2 != 0:
-            order.save()
             return Response(
                 {"error": "Invalid number: must be even and up to 8 digits."},
                 HTTP_400_BAD_REQUEST,
             )
 
-        if number[-1] == "0" or int(number) % 2 != 0:
-            errors = [
-                "Payment declined by bank.",
-                "Insufficient funds.",
-                "Card expired.",
-                "Technical error. Try again later.",
-            ]
-            order.save()
-            return Response(
-                {"error": random.choice(errors)}, HTTP_400_BAD_REQUEST
-            )
-        else:
-            order.status = "paid"
-            order.save()
+        # Номер, оканчивающийся на 0, эмулирует отказ банка
+        if number[-1] == "0":
             return Response(
-                {
-                    "message": "Waiting for confirmation from payment system."
-                },
-                HTTP_200_OK,
+                {"error": random.choice(PAYMENT_ERRORS)}, HTTP_400_BAD_REQUEST
             )
+        order.status = "paid"
+        order.confirmedAt = order.confirmedAt or timezone.now()
+        order.save(update_fields=["status", "confirmedAt"])
+        return Response(
+            {"message": "Waiting for confirmation from payment system."},
+            HTTP_200_OK,
+        )
@@ -15,7 +15,8 @@ class ProductAdmin(admin.ModelAdmin):
         "id",
         "title",
         "category",
-        "price",
+        "standart_price",
+        "effective_price",
         "count",
         "freeDelivery",
         "limitedEdition",
@@ -24,7 +25,13 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ("category", "freeDelivery", "tags")
     search_fields = ("title", "description")
     filter_horizontal = ("images", "tags")
-    readonly_fields = ("rating", "reviews")
+    readonly_fields = (
+        "rating",
+        "reviews",
+        "effective_price",
+        "review_count",
+        "rating_avg",
+    )
 
 
 class SaleItemAdmin(admin.ModelAdmin):
@@ -0,0 +1,209 @@
+import functools
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+from rest_framework.status import HTTP_200_OK
+
+
+GENERATION_KEY = "catalog:generation"
+CHANGES_KEY = "catalog:changes:{}"
+MODIFIED_KEY = "catalog:modified"
+
+
+def get_counter(key):
+    """Текущее значение счётчика версий в кэше"""
+    value = cache.get(key)
+    if value is None:
+        # Счётчик мог быть вытеснен из кэша. Стартую с текущего времени,
+        # чтобы не совпасть с версиями старых записей
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump_counter(key):
+    """Увеличивает счётчик версий и возвращает новое значение"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        get_counter(key)
+        return cache.incr(key)
+
+
+def get_generation():
+    """Текущее поколение данных каталога"""
+    return get_counter(GENERATION_KEY)
+
+
+def get_last_modified():
+    """Время последнего изменения данных каталога (timestamp)"""
+    modified = cache.get(MODIFIED_KEY)
+    if modified is None:
+        cache.add(MODIFIED_KEY, time.time(), timeout=None)
+        modified = cache.get(MODIFIED_KEY)
+    return modified
+
+
+def bump_generation(product_ids=None):
+    """
+    Делает все закэшированные ответы каталога устаревшими.
+
+    product_ids - какие продукты изменились (пустой набор, если изменения
+    не касаются полей продуктов). Журнал изменений по поколениям нужен для
+    инкрементальной пересборки снимка каталога; None означает, что
+    изменилось неизвестно что и снимок надо собрать заново.
+    """
+    generation = bump_counter(GENERATION_KEY)
+    cache.set(MODIFIED_KEY, time.time(), timeout=None)
+    if product_ids is not None:
+        cache.set(
+            CHANGES_KEY.format(generation),
+            sorted(set(product_ids)),
+            timeout=settings.CATALOG_CHANGES_TTL,
+        )
+    return generation
+
+
+def bump_generation_on_commit(product_ids=None):
+    """
+    bump_generation() после коммита текущей транзакции (сразу, если её
+    нет). Иначе запрос между сбросом и коммитом закэшировал бы старые
+    данные под новым поколением.
+    """
+    transaction.on_commit(functools.partial(bump_generation, product_ids))
+
+
+def get_changes(since, until, limit):
+    """
+    Объединённый набор id продуктов, изменённых в поколениях (since, until].
+    Возвращает None, если журнал неполон или длиннее limit поколений и
+    нужна полная пересборка.
+    """
+    if until < since or until - since > limit:
+        # В том числе счётчик поколений был вытеснен и начат заново с
+        # текущего времени: разрыв - миллионы поколений без журнала
+        return None
+    keys = [CHANGES_KEY.format(g) for g in range(since + 1, until + 1)]
+    entries = cache.get_many(keys)
+    if len(entries) != len(keys):
+        return None
+    changed = set()
+    for product_ids in entries.values():
+        changed.update(product_ids)
+    return changed
+
+
+def response_key(request):
+    """Ключ кэша по пути и нормализованным параметрам запроса"""
+    params = sorted(
+        (key, sorted(values)) for key, values in request.query_params.lists()
+    )
+    raw = f"{request.path}?{params}".encode()
+    return "catalog:response:" + hashlib.md5(raw).hexdigest()
+
+
+def _cached(entry):
+    """Ответ из записи кэша с версией данных, по которой он построен"""
+    response = Response(entry["data"], HTTP_200_OK)
+    response.catalog_version = (entry["generation"], entry.get("modified", 0))
+    return response
+
+
+def cache_response(view_method):
+    """
+    Кэширует успешные ответы GET-метода APIView.
+
+    Запись хранит поколение каталога и мягкий срок жизни. Если запись
+    устарела, ответ перестраивает только воркер, взявший блокировку,
+    а остальные в это время отдают старую копию. Версия данных ответа
+    (поколение и время изменения) кладётся в response.catalog_version,
+    из неё conditional_response строит ETag и Last-Modified.
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        key = response_key(request)
+        generation = get_generation()
+        modified = get_last_modified()
+        entry = cache.get(key)
+        if (
+            entry is not None
+            and entry["generation"] == generation
+            and entry["expires"] > time.time()
+        ):
+            return _cached(entry)
+
+        lock_key = key + ":lock"
+        if entry is not None and not cache.add(
+            lock_key, 1, timeout=settings.CATALOG_CACHE_LOCK_TIMEOUT
+        ):
+            # Старая копия помечается своим поколением, а не текущим
+            return _cached(entry)
+
+        try:
+            response = view_method(view, request, *args, **kwargs)
+            if response.status_code == HTTP_200_OK:
+                response.catalog_version = (generation, modified)
+                ttl = settings.CATALOG_CACHE_TTL
+                cache.set(
+                    key,
+                    {
+                        "generation": generation,
+                        "modified": modified,
+                        "expires": time.time() + ttl,
+                        "data": response.data,
+                    },
+                    # Жёсткий срок больше мягкого, чтобы было что отдать
+                    # во время перестройки
+                    timeout=ttl * settings.CATALOG_CACHE_STALE_FACTOR,
+                )
+        finally:
+            if entry is not None:
+                cache.delete(lock_key)
+        return response
+
+    return wrapper
+
+
+def conditional_response(view_method):
+    """
+    Поддерживает условные GET (If-None-Match / If-Modified-Since).
+
+    ETag и Last-Modified выводятся из поколения каталога, поэтому
+    совпадающий запрос получает 304 без обращения к базе и сериализаторам.
+    Любое изменение каталога (в том числе через админку) меняет поколение.
+    Отданный ответ помечается версией, по которой построено его тело
+    (catalog_version из cache_response): устаревшая копия получает ETag
+    старого поколения и при перепроверке не подтверждается 304.
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        generation = get_generation()
+        modified = get_last_modified()
+        # Last-Modified точен до секунды; изменения внутри одной секунды
+        # различает ETag, который проверяется первым
+        response = get_conditional_response(
+            request,
+            etag=f'W/"{generation}"',
+            last_modified=int(modified),
+        )
+        if response is None:
+            response = view_method(view, request, *args, **kwargs)
+            if response.status_code != HTTP_200_OK:
+                return response
+            generation, modified = getattr(
+                response, "catalog_version", (generation, modified)
+            )
+        response.headers["ETag"] = f'W/"{generation}"'
+        response.headers["Last-Modified"] = http_date(int(modified))
+        # Браузер хранит ответ, но перепроверяет его при каждом запросе
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    return wrapper
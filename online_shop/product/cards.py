@@ -0,0 +1,116 @@
+"""
+Быстрое построение карточек продуктов.
+
+Карточка (ProductShortSerializer) - самый частый объект в ответах API.
+Вместо обхода полей DRF-сериализатора для каждого продукта строки
+читаются через values(), связанные изображения, теги и отзывы - тремя
+запросами к таблицам связей на всю страницу, а словарь карточки
+собирается одной функцией. Результат совпадает с
+ProductShortSerializer(...).data (это проверяют тесты), поэтому при
+изменении сериализатора нужно поменять и build_card().
+
+Связанные объекты упорядочены по id - в том же порядке их отдаёт
+prefetch по индексу таблицы связей.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.utils import timezone
+from user.models import Image
+from .models import Product
+
+CARD_COLUMNS = (
+    "id",
+    "category_id",
+    "title",
+    "effective_price",
+    "count",
+    "date",
+    "description",
+    "freeDelivery",
+    "rating",
+)
+
+
+def format_datetime(value):
+    """Дата в формате DRF DateTimeField (ISO 8601, UTC как "Z")"""
+    if settings.USE_TZ:
+        value = value.astimezone(timezone.get_current_timezone())
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def build_card(row, images, tags, reviews):
+    """Собирает карточку из строки values() и связанных объектов"""
+    return {
+        "id": row["id"],
+        "category": row["category_id"],
+        "title": row["title"],
+        "price": row["effective_price"],
+        "count": row["count"],
+        "date": format_datetime(row["date"]) if row["date"] else None,
+        "description": row["description"],
+        "freeDelivery": row["freeDelivery"],
+        "images": images,
+        "tags": tags,
+        "reviews": reviews,
+        "rating": row["rating"],
+    }
+
+
+def _related(through, product_ids, *columns):
+    """Строки таблицы связей, сгруппированные по продукту"""
+    grouped = defaultdict(list)
+    rows = (
+        through.objects.filter(product_id__in=product_ids)
+        .order_by("product_id", columns[0])
+        .values_list("product_id", *columns)
+    )
+    for product_id, *values in rows:
+        grouped[product_id].append(values)
+    return grouped
+
+
+def product_cards(products):
+    """Карточки продуктов queryset'а в его порядке"""
+    rows = list(products.prefetch_related(None).values(*CARD_COLUMNS))
+    product_ids = [row["id"] for row in rows]
+    if not product_ids:
+        return []
+
+    storage = Image._meta.get_field("src").storage
+    images = _related(
+        Product.images.through,
+        product_ids,
+        "image_id",
+        "image__src",
+        "image__alt",
+    )
+    tags = _related(Product.tags.through, product_ids, "tag_id", "tag__name")
+    reviews = _related(Product.reviews.through, product_ids, "review_id")
+
+    cards = []
+    for row in rows:
+        product_id = row["id"]
+        cards.append(
+            build_card(
+                row,
+                [
+                    {"src": storage.url(src) if src else None, "alt": alt}
+                    for _, src, alt in images[product_id]
+                ],
+                [{"id": pk, "name": name} for pk, name in tags[product_id]],
+                [pk for (pk,) in reviews[product_id]],
+            )
+        )
+    return cards
+
+
+def product_cards_by_id(product_ids):
+    """Карточки продуктов в порядке списка product_ids"""
+    cards = {
+        card["id"]: card
+        for card in product_cards(Product.objects.filter(pk__in=product_ids))
+    }
+    return [cards[pk] for pk in product_ids if pk in cards]
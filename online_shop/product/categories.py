@@ -0,0 +1,66 @@
+"""
+Кэшированное дерево категорий.
+
+Дерево двухуровневое (см. Category.clean), поэтому целиком строится
+одним запросом с JOIN изображения. В кэше вместе с ним лежит карта
+"категория -> она сама и её подкатегории" для фильтра каталога.
+Дерево хранится под собственной версией, которую меняют только правки
+категорий и изображений, а не любое изменение каталога.
+"""
+from django.core.cache import cache
+from .cache import bump_counter, get_counter
+from .models import Category
+
+VERSION_KEY = "catalog:categories:version"
+TREE_KEY = "catalog:categories:{}"
+TREE_TIMEOUT = 24 * 60 * 60
+
+
+def _image(image):
+    if image is None:
+        return None
+    return {"src": image.src.url if image.src else None, "alt": image.alt}
+
+
+def build_category_tree():
+    """Строит дерево категорий одним запросом"""
+    categories = Category.objects.select_related("image").order_by("pk")
+    nodes = {}
+    children = {}
+    for category in categories:
+        nodes[category.pk] = {
+            "id": category.pk,
+            "title": category.title,
+            "image": _image(category.image),
+        }
+        children.setdefault(category.parent_id, []).append(category.pk)
+
+    roots = []
+    for pk in children.get(None, []):
+        node = dict(nodes[pk])
+        node["subcategories"] = [
+            nodes[child] for child in children.get(pk, [])
+        ]
+        roots.append(node)
+    descendants = {pk: [pk] + children.get(pk, []) for pk in nodes}
+    return {"roots": roots, "descendants": descendants}
+
+
+def get_category_tree():
+    """Дерево категорий из кэша (перестраивается после изменений)"""
+    key = TREE_KEY.format(get_counter(VERSION_KEY))
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_category_tree()
+        cache.set(key, tree, timeout=TREE_TIMEOUT)
+    return tree
+
+
+def invalidate_category_tree():
+    bump_counter(VERSION_KEY)
+
+
+def category_with_descendants(category_id):
+    """id категории и всех её подкатегорий по кэшированному дереву"""
+    category_id = int(category_id)
+    return get_category_tree()["descendants"].get(category_id, [category_id])
@@ -0,0 +1,41 @@
+from django.db.models import Count, Max, Min, Q
+from .models import Product
+
+
+def catalog_facets(products):
+    """
+    Считает фасеты боковой панели для отфильтрованных продуктов.
+
+    Все показатели по продуктам собираются одним агрегирующим запросом,
+    счётчики тегов - одним GROUP BY по таблице связей продукт-тег.
+    """
+    products = products.order_by()
+    stats = products.aggregate(
+        total=Count("pk"),
+        min_price=Min("effective_price"),
+        max_price=Max("effective_price"),
+        free_delivery=Count("pk", filter=Q(freeDelivery=True)),
+        available=Count("pk", filter=Q(count__gt=0)),
+    )
+    tags = (
+        Product.tags.through.objects.filter(
+            product_id__in=products.values("pk")
+        )
+        .values("tag_id", "tag__name")
+        .annotate(count=Count("product_id"))
+        .order_by("-count", "tag__name")
+    )
+    return {
+        "total": stats["total"],
+        "price": {"min": stats["min_price"], "max": stats["max_price"]},
+        "freeDelivery": stats["free_delivery"],
+        "available": stats["available"],
+        "tags": [
+            {
+                "id": tag["tag_id"],
+                "name": tag["tag__name"],
+                "count": tag["count"],
+            }
+            for tag in tags
+        ],
+    }
@@ -0,0 +1,54 @@
+import time
+from django.core.management.base import BaseCommand
+from online_shop.queryplan import plan_queryset
+from online_shop.renderers import FastJSONRenderer
+from product.cards import product_cards
+from product.models import Product
+from product.serializers import ProductShortSerializer
+from rest_framework.renderers import JSONRenderer
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает стоимость карточки продукта: DRF-сериализатор с
+    JSONRenderer против product_cards() с FastJSONRenderer.
+    """
+
+    help = "Measure per-card cost of the DRF and fast product card paths"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def measure(self, build, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            body = build()
+        return time.perf_counter() - started, body
+
+    def handle(self, *args, **options):
+        limit, repeat = options["limit"], options["repeat"]
+        products = Product.objects.order_by("-date", "-id")[:limit]
+        size = products.count()
+        if not size:
+            self.stdout.write("No products to benchmark")
+            return
+
+        def drf():
+            cards = ProductShortSerializer(
+                plan_queryset(products, ProductShortSerializer), many=True
+            ).data
+            return JSONRenderer().render(cards)
+
+        def fast():
+            return FastJSONRenderer().render(product_cards(products))
+
+        for name, build in (("drf", drf), ("fast", fast)):
+            elapsed, body = self.measure(build, repeat)
+            per_card = elapsed / (repeat * size) * 1e6
+            self.stdout.write(
+                f"{name}: {per_card:.1f} us per card "
+                f"({size} cards, {len(body)} bytes)"
+            )
+        if drf() != fast():
+            self.stderr.write("Warning: outputs differ")
@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand
+from product.cache import get_generation
+from product.snapshot import build_snapshot, load_snapshot
+
+
+class Command(BaseCommand):
+    """
+    Собирает колоночный снимок каталога. С --watch работает постоянно
+    и пересобирает снимок инкрементально после каждого изменения каталога.
+    """
+
+    help = "Build the columnar catalog snapshot used by the catalog view"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Ignore the existing snapshot and read the whole catalog",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep running and rebuild when the catalog changes",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds between generation checks in --watch mode",
+        )
+
+    def handle(self, *args, **options):
+        snapshot = None if options["full"] else load_snapshot()
+        while True:
+            if snapshot is None or snapshot.generation != get_generation():
+                snapshot = build_snapshot(previous=snapshot)
+                self.stdout.write(
+                    f"Catalog snapshot {snapshot.path.name} built "
+                    f"({snapshot.size} products)"
+                )
+            if not options["watch"]:
+                break
+            time.sleep(options["interval"])
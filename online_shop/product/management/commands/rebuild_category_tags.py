@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from product.cache import bump_generation
+from product.models import CategoryTag
+
+
+class Command(BaseCommand):
+    """Пересчитывает наборы тегов всех категорий"""
+
+    help = "Rebuild per-category tag sets used by the tag list"
+
+    def handle(self, *args, **options):
+        links = CategoryTag.objects.rebuild()
+        bump_generation([])
+        self.stdout.write(f"Category tags rebuilt: {len(links)} links")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from product.cache import bump_generation
+from product.models import Product
+
+
+class Command(BaseCommand):
+    """Пересчитывает счётчики отзывов и средние оценки всех продуктов"""
+
+    help = "Rebuild review counts and average ratings of all products"
+
+    def handle(self, *args, **options):
+        updated = Product.objects.refresh_review_stats()
+        bump_generation()
+        self.stdout.write(f"Review stats rebuilt for {updated} products")
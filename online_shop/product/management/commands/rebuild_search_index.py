@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from product.cache import bump_generation
+from product.search import search_enabled, update_search_vectors
+
+
+class Command(BaseCommand):
+    """Пересчитывает поисковые векторы всех продуктов"""
+
+    help = "Rebuild full-text search vectors of all products"
+
+    def handle(self, *args, **options):
+        if not search_enabled():
+            self.stdout.write("Full-text search requires PostgreSQL")
+            return
+        updated = update_search_vectors()
+        bump_generation()
+        self.stdout.write(f"Search vectors rebuilt for {updated} products")
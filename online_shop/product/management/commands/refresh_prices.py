@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from product.cache import bump_generation
+from product.models import Product
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает итоговые цены всех продуктов.
+
+    Запускается по расписанию (например, раз в сутки в полночь), чтобы цены
+    менялись при открытии и закрытии окна акции, а не только при её правке.
+    """
+
+    help = "Recompute effective prices of all products"
+
+    def handle(self, *args, **options):
+        updated = Product.objects.refresh_prices()
+        bump_generation()
+        self.stdout.write(f"Prices refreshed for {updated} products")
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:24
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_effective_price(apps, schema_editor):
+    Product = apps.get_model("product", "Product")
+    SaleItem = apps.get_model("product", "SaleItem")
+    sale_price = (
+        SaleItem.objects.filter(product=OuterRef("pk"))
+        .order_by("pk")
+        .values("salePrice")[:1]
+    )
+    Product.objects.update(
+        effective_price=Coalesce(Subquery(sale_price), F("standart_price"))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0009_alter_product_count_and_more"),
+        ("user", "0009_remove_order_products_remove_category_image_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="effective_price",
+            field=models.DecimalField(
+                decimal_places=2, default=0, editable=False, max_digits=10
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["effective_price"], name="product_pro_effecti_a9539e_idx"
+            ),
+        ),
+        migrations.RunPython(fill_effective_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:28
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+
+# GIN-индексы есть только в PostgreSQL, поэтому они создаются вручную,
+# а в SQLite (тесты) миграция их пропускает
+INDEXES = {
+    "product_pro_search_gin_idx": "USING gin (search_vector)",
+    "product_pro_title_trgm_idx": "USING gin (title gin_trgm_ops)",
+}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, definition in INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} " f"ON product_product {definition}"
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def fill_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Product = apps.get_model("product", "Product")
+    Tag = apps.get_model("product", "Tag")
+    config = settings.SEARCH_CONFIG
+    tag_names = (
+        Tag.objects.filter(products=OuterRef("pk"))
+        .values("products")
+        .annotate(names=StringAgg("name", " "))
+        .values("names")
+    )
+    Product.objects.update(
+        search_vector=SearchVector("title", weight="A", config=config)
+        + SearchVector("description", weight="B", config=config)
+        + SearchVector(
+            Coalesce(Subquery(tag_names), Value(""), output_field=TextField()),
+            weight="C",
+            config=config,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0010_product_effective_price"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:31
+
+from django.db import migrations, models
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Sum,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.lookups import GreaterThan
+
+
+def fill_review_stats(apps, schema_editor):
+    Product = apps.get_model("product", "Product")
+    Review = apps.get_model("product", "Review")
+    reviews = Review.objects.filter(products=OuterRef("pk")).values("products")
+    review_count = Coalesce(Subquery(reviews.annotate(n=Count("pk")).values("n")), 0)
+    rate_sum = Coalesce(
+        Subquery(reviews.annotate(total=Sum("rate")).values("total")), 0
+    )
+    average = ExpressionWrapper(
+        Cast(rate_sum, FloatField()) / review_count,
+        output_field=FloatField(),
+    )
+    has_reviews = GreaterThan(review_count, 0)
+    Product.objects.update(
+        review_count=review_count,
+        review_rate_sum=rate_sum,
+        rating_avg=Case(
+            When(has_reviews, then=average),
+            default=F("rating"),
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        ),
+        rating=Case(
+            When(has_reviews, then=Round(average)),
+            default=F("rating"),
+            output_field=IntegerField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0011_product_search_vector"),
+        ("user", "0009_remove_order_products_remove_category_image_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="rating_avg",
+            field=models.DecimalField(
+                decimal_places=2, default=0, editable=False, max_digits=3
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="review_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="review_rate_sum",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["review_count"], name="product_pro_review__3ce7eb_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["rating_avg"], name="product_pro_rating__cd4e7e_idx"
+            ),
+        ),
+        migrations.RunPython(fill_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_category_tags(apps, schema_editor):
+    Product = apps.get_model("product", "Product")
+    CategoryTag = apps.get_model("product", "CategoryTag")
+    counts = (
+        Product.tags.through.objects.values("product__category_id", "tag_id")
+        .annotate(product_count=Count("product_id"))
+        .order_by()
+    )
+    CategoryTag.objects.bulk_create(
+        CategoryTag(
+            category_id=row["product__category_id"],
+            tag_id=row["tag_id"],
+            product_count=row["product_count"],
+        )
+        for row in counts
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0012_product_review_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CategoryTag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("product_count", models.PositiveIntegerField(default=0)),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tag_links",
+                        to="product.category",
+                    ),
+                ),
+                (
+                    "tag",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="category_links",
+                        to="product.tag",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("category", "tag"), name="unique_category_tag"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_category_tags, migrations.RunPython.noop),
+    ]
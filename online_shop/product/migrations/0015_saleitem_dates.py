@@ -0,0 +1,143 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:47
+
+import datetime
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def parse_day(value, year):
+    """
+    Разбирает строковую дату акции. API отдавал даты как MM-DD ("05-20"),
+    но в старых данных встречается и DD-MM ("24-07").
+    """
+    value = (value or "").strip()
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        pass
+    parts = value.replace(".", "-").replace("/", "-").split("-")
+    if len(parts) != 2 or not all(part.isdigit() for part in parts):
+        return None
+    first, second = int(parts[0]), int(parts[1])
+    month, day = (second, first) if first > 12 else (first, second)
+    try:
+        return datetime.date(year, month, day)
+    except ValueError:
+        return None
+
+
+def convert_dates(apps, schema_editor):
+    SaleItem = apps.get_model("product", "SaleItem")
+    today = timezone.localdate()
+    # Нераспознанные даты делают акцию неактивной, её видно в админке
+    fallback = today - datetime.timedelta(days=1)
+    for sale in SaleItem.objects.all():
+        date_from = parse_day(sale.dateFrom, today.year)
+        date_to = parse_day(sale.dateTo, today.year)
+        if date_from and date_to and date_to < date_from:
+            # Акция переходит через Новый год
+            date_to = date_to.replace(year=date_to.year + 1)
+        sale.date_from = date_from or fallback
+        sale.date_to = max(date_to or fallback, sale.date_from)
+        sale.save(update_fields=["date_from", "date_to"])
+
+
+def restore_dates(apps, schema_editor):
+    SaleItem = apps.get_model("product", "SaleItem")
+    for sale in SaleItem.objects.all():
+        sale.dateFrom = sale.date_from.strftime("%m-%d")
+        sale.dateTo = sale.date_to.strftime("%m-%d")
+        sale.save(update_fields=["dateFrom", "dateTo"])
+
+
+def refresh_effective_price(apps, schema_editor):
+    Product = apps.get_model("product", "Product")
+    SaleItem = apps.get_model("product", "SaleItem")
+    today = timezone.localdate()
+    sale_price = (
+        SaleItem.objects.filter(
+            product=OuterRef("pk"), dateFrom__lte=today, dateTo__gte=today
+        )
+        .order_by("pk")
+        .values("salePrice")[:1]
+    )
+    Product.objects.update(
+        effective_price=Coalesce(Subquery(sale_price), F("standart_price"))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0014_product_popularity"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="saleitem",
+            name="date_from",
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name="saleitem",
+            name="date_to",
+            field=models.DateField(null=True),
+        ),
+        # Старые поля временно допускают NULL, чтобы миграцию можно было
+        # откатить на непустой таблице
+        migrations.AlterField(
+            model_name="saleitem",
+            name="dateFrom",
+            field=models.CharField(max_length=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name="saleitem",
+            name="dateTo",
+            field=models.CharField(max_length=10, null=True),
+        ),
+        migrations.RunPython(convert_dates, restore_dates),
+        migrations.RemoveField(
+            model_name="saleitem",
+            name="dateFrom",
+        ),
+        migrations.RemoveField(
+            model_name="saleitem",
+            name="dateTo",
+        ),
+        migrations.RenameField(
+            model_name="saleitem",
+            old_name="date_from",
+            new_name="dateFrom",
+        ),
+        migrations.RenameField(
+            model_name="saleitem",
+            old_name="date_to",
+            new_name="dateTo",
+        ),
+        migrations.AlterField(
+            model_name="saleitem",
+            name="dateFrom",
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name="saleitem",
+            name="dateTo",
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name="saleitem",
+            index=models.Index(
+                fields=["product", "dateFrom", "dateTo"],
+                name="product_sal_product_df4b87_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="saleitem",
+            index=models.Index(
+                fields=["dateTo", "dateFrom"], name="product_sal_dateTo_959ab3_idx"
+            ),
+        ),
+        migrations.RunPython(refresh_effective_price, migrations.RunPython.noop),
+    ]
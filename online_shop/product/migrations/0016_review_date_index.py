@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0015_saleitem_dates"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["date", "id"], name="product_rev_date_7fe066_idx"
+            ),
+        ),
+    ]
@@ -1,6 +1,24 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    Exists,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Sum,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.lookups import GreaterThan
 from user.models import Image
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
@@ -64,6 +82,8 @@ class Review(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=["rate"]),
+            # Страницы отзывов по дате (keyset по паре date, id)
+            models.Index(fields=["date", "id"]),
         ]
 
     def __str__(self):
@@ -80,6 +100,97 @@ class Specification(models.Model):
         return f"{self.name}: {self.value}"
 
 
+def _rating_fields(review_count, rate_sum):
+    """
+    Выражения средней оценки по новым значениям счётчиков. Пока отзывов нет,
+    средней оценкой считается выставленный вручную rating.
+    """
+    average = ExpressionWrapper(
+        Cast(rate_sum, FloatField()) / review_count,
+        output_field=FloatField(),
+    )
+    has_reviews = GreaterThan(review_count, 0)
+    return {
+        "rating_avg": Case(
+            When(has_reviews, then=average),
+            default=F("rating"),
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        ),
+        "rating": Case(
+            When(has_reviews, then=Round(average)),
+            default=F("rating"),
+            output_field=IntegerField(),
+        ),
+    }
+
+
+class ProductQuerySet(models.QuerySet):
+    def refresh_prices(self):
+        """
+        Пересчитывает effective_price одним UPDATE: цена первой
+        действующей сегодня акции на продукт, а если таких нет -
+        стандартная цена. Начало и конец акций сами запись не вызывают,
+        поэтому команду refresh_prices нужно запускать раз в сутки.
+        """
+        sale_price = (
+            SaleItem.objects.active()
+            .filter(product=OuterRef("pk"))
+            .order_by("pk")
+            .values("salePrice")[:1]
+        )
+        return self.update(
+            effective_price=Coalesce(Subquery(sale_price), F("standart_price"))
+        )
+
+    def add_review_stats(self, count, rate_sum):
+        """
+        Инкрементально учитывает добавленные отзывы (или удалённые - с
+        отрицательными count и rate_sum) одним UPDATE.
+        """
+        review_count = F("review_count") + count
+        review_rate_sum = F("review_rate_sum") + rate_sum
+        return self.update(
+            review_count=review_count,
+            review_rate_sum=review_rate_sum,
+            **_rating_fields(review_count, review_rate_sum),
+        )
+
+    def refresh_review_stats(self):
+        """Полностью пересчитывает счётчики отзывов одним UPDATE"""
+        reviews = Review.objects.filter(products=OuterRef("pk")).values(
+            "products"
+        )
+        review_count = Coalesce(
+            Subquery(reviews.annotate(n=Count("pk")).values("n")), 0
+        )
+        review_rate_sum = Coalesce(
+            Subquery(reviews.annotate(total=Sum("rate")).values("total")), 0
+        )
+        return self.update(
+            review_count=review_count,
+            review_rate_sum=review_rate_sum,
+            **_rating_fields(review_count, review_rate_sum),
+        )
+
+    def with_tags(self, tag_ids, match_all=False):
+        """
+        Продукты, у которых есть любой (match_all - каждый) из тегов.
+        Проверка идёт полусоединением EXISTS по таблице связей, поэтому
+        строки продуктов не размножаются и DISTINCT не нужен.
+        """
+        tag_ids = {int(tag_id) for tag_id in tag_ids}
+        links = self.model.tags.through.objects.filter(
+            product_id=OuterRef("pk"), tag_id__in=tag_ids
+        )
+        if match_all:
+            links = (
+                links.values("product_id")
+                .annotate(matched=Count("tag_id"))
+                .filter(matched=len(tag_ids))
+            )
+        return self.filter(Exists(links))
+
+
 class Product(models.Model):
     """Модель продукта"""
 
@@ -88,6 +199,10 @@ class Product(models.Model):
     )
     title = models.CharField(max_length=255)
     standart_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Итоговая цена с учётом акций, поддерживается сигналами SaleItem
+    effective_price = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, editable=False
+    )
     count = models.PositiveIntegerField(default=0)
     date = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True)
@@ -102,28 +217,61 @@ class Product(models.Model):
         "Specification", related_name="products", blank=True
     )
     rating = models.IntegerField(default=0)
+    # Счётчики отзывов, поддерживаются сигналами Product.reviews
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    review_rate_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.DecimalField(
+        max_digits=3, decimal_places=2, default=0, editable=False
+    )
     sort_index = models.IntegerField(default=0)
     limitedEdition = models.BooleanField(default=False)
+    # Поисковый вектор (title, description, теги), GIN-индекс в миграции
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         indexes = [
             models.Index(fields=["category"]),
             models.Index(fields=["title"]),
             models.Index(fields=["sort_index"]),
+            models.Index(fields=["effective_price"]),
+            models.Index(fields=["review_count"]),
+            models.Index(fields=["rating_avg"]),
         ]
 
     # Для работы скидок
     @property
     def price(self):
-        sale = self.sales.first()
-        if sale:
-            return sale.salePrice
-        return self.standart_price
+        return self.effective_price
+
+    def save(self, *args, **kwargs):
+        sale_price = None
+        if self.pk:
+            sale_price = (
+                self.sales.active()
+                .order_by("pk")
+                .values_list("salePrice", flat=True)
+                .first()
+            )
+        self.effective_price = (
+            sale_price if sale_price is not None else self.standart_price
+        )
+        if not self.review_count:
+            self.rating_avg = self.rating
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.title
 
 
+class SaleItemQuerySet(models.QuerySet):
+    def active(self, day=None):
+        """Акции, действующие в день day (по умолчанию - сегодня)"""
+        day = day or timezone.localdate()
+        return self.filter(dateFrom__lte=day, dateTo__gte=day)
+
+
 class SaleItem(models.Model):
     """Модель акции на продукт"""
 
@@ -131,25 +279,107 @@ class SaleItem(models.Model):
         Product, on_delete=models.CASCADE, related_name="sales"
     )
     salePrice = models.DecimalField(max_digits=10, decimal_places=2)
-    dateFrom = models.CharField(max_length=10)
-    dateTo = models.CharField(max_length=10)
+    # Акция действует с dateFrom по dateTo включительно
+    dateFrom = models.DateField()
+    dateTo = models.DateField()
+
+    objects = SaleItemQuerySet.as_manager()
 
     class Meta:
         indexes = [
             models.Index(fields=["product"]),
+            # Активные акции продукта (расчёт effective_price)
+            models.Index(fields=["product", "dateFrom", "dateTo"]),
+            # Список активных акций: истёкшие отсекаются по dateTo
+            models.Index(fields=["dateTo", "dateFrom"]),
         ]
 
-    @property
-    def title(self):
+    def __str__(self):
         return self.product.title
 
-    @property
-    def price(self):
-        return self.product.standart_price
 
-    @property
-    def images(self):
-        return self.product.images.all()
+class CategoryTagQuerySet(models.QuerySet):
+    def rebuild(self, category_ids=None):
+        """
+        Пересчитывает наборы тегов категорий (все или только category_ids)
+        одним GROUP BY по таблице связей продукт-тег.
+        """
+        links = Product.tags.through.objects.all()
+        stale = self
+        if category_ids is not None:
+            links = links.filter(product__category_id__in=category_ids)
+            stale = self.filter(category_id__in=category_ids)
+        counts = (
+            links.values("product__category_id", "tag_id")
+            .annotate(product_count=Count("product_id"))
+            .order_by()
+        )
+        with transaction.atomic():
+            stale.delete()
+            return self.bulk_create(
+                CategoryTag(
+                    category_id=row["product__category_id"],
+                    tag_id=row["tag_id"],
+                    product_count=row["product_count"],
+                )
+                for row in counts
+            )
+
+
+class CategoryTag(models.Model):
+    """
+    Теги, встречающиеся у продуктов категории, с числом таких продуктов.
+    Поддерживается сигналами Product.tags и сменой категории продукта.
+    """
+
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name="tag_links"
+    )
+    tag = models.ForeignKey(
+        Tag, on_delete=models.CASCADE, related_name="category_links"
+    )
+    product_count = models.PositiveIntegerField(default=0)
+
+    objects = CategoryTagQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["category", "tag"], name="unique_category_tag"
+            ),
+        ]
 
     def __str__(self):
-        return self.product.title
+        return f"{self.category} - {self.tag}"
+
+
+class ProductPopularity(models.Model):
+    """
+    Популярность продукта по продажам: сумма проданных штук с
+    экспоненциальным затуханием. Заполняется задачей rank_popular_products.
+    """
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="popularity",
+    )
+    score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-score"]),
+        ]
+
+    def __str__(self):
+        return f"{self.product} ({self.score:.2f})"
+
+
+class PopularityState(models.Model):
+    """Отметка, до которой заказы уже учтены в популярности"""
+
+    processed_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Popularity processed until {self.processed_until}"
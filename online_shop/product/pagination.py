@@ -0,0 +1,125 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connection
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или не подходит к текущей сортировке"""
+
+
+def _default(value):
+    # DjangoJSONEncoder обрезает микросекунды, а для keyset нужна точность
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_cursor(sort_field, value, pk):
+    """
+    Кодирует последнюю пару (ключ сортировки, id) страницы в непрозрачную
+    строку, которую фронт передаёт обратно в параметре cursor.
+    """
+    raw = json.dumps([sort_field, value, pk], default=_default)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort_field):
+    """Раскодирует курсор и возвращает пару (значение ключа, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        field, value, pk = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if field != sort_field or not isinstance(pk, int):
+        raise InvalidCursor("Cursor does not match sorting")
+    return value, pk
+
+
+def _to_python(queryset, field, value):
+    """Приводит значение из JSON к типу поля модели (Decimal, datetime...)"""
+    try:
+        model_field = queryset.model._meta.get_field(field)
+    except FieldDoesNotExist:
+        # Аннотации (например, количество отзывов) приходят как числа
+        return value
+    try:
+        return model_field.to_python(value)
+    except ValidationError:
+        raise InvalidCursor("Invalid cursor value")
+
+
+def keyset_page(queryset, sort_field, descending, cursor, limit):
+    """
+    Возвращает страницу из limit объектов после курсора и курсор следующей
+    страницы (None, если страница последняя).
+
+    Вместо OFFSET используется условие по паре (ключ, id), поэтому глубокие
+    страницы стоят столько же, сколько первая, и COUNT не нужен.
+    """
+    op = "lt" if descending else "gt"
+    prefix = "-" if descending else ""
+    queryset = queryset.order_by(prefix + sort_field, prefix + "id")
+
+    if cursor:
+        value, pk = decode_cursor(cursor, sort_field)
+        value = _to_python(queryset, sort_field, value)
+        queryset = queryset.filter(
+            Q(**{f"{sort_field}__{op}": value})
+            | Q(**{sort_field: value, f"id__{op}": pk})
+        )
+
+    items = list(queryset[: limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(
+            sort_field, getattr(last, sort_field), last.id
+        )
+    return items, next_cursor
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк по плану запроса PostgreSQL (без выполнения).
+    Для остальных СУБД возвращает None.
+    """
+    if connection.vendor != "postgresql":
+        return None
+    plan = json.loads(queryset.explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_results(queryset, threshold):
+    """
+    Считает результаты выдачи так, чтобы цена не росла с размером таблицы.
+
+    Возвращает пару (total, mode):
+    - "exact" - результатов не больше threshold, посчитаны точно;
+    - "estimate" - больше threshold, взята оценка планировщика PostgreSQL;
+    - "capped" - больше threshold, оценки нет, total равен threshold
+      (на фронте отображается как "threshold+").
+    """
+    queryset = queryset.order_by()
+    # COUNT по подзапросу с LIMIT читает не больше threshold + 1 строк
+    capped = queryset[: threshold + 1].count()
+    if capped <= threshold:
+        return capped, "exact"
+    estimate = estimate_count(queryset)
+    if estimate is not None and estimate > threshold:
+        return estimate, "estimate"
+    return threshold, "capped"
+
+
+def last_page_number(total, mode, limit):
+    """Номер последней страницы; при обрезанном подсчёте есть ещё одна"""
+    if mode == "capped":
+        total += 1
+    return (total + limit - 1) // limit
@@ -0,0 +1,48 @@
+"""
+Популярные продукты.
+
+Порядок выдачи: sort_index из админки, затем очки продаж (ProductPopularity,
+см. order/popularity.py), а продукты без продаж - по средней оценке.
+Сортировать весь каталог через JOIN с таблицей популярности не нужно:
+верх рейтинга читается по индексу -score, а немногие продукты с ручным
+sort_index и добор по оценке подмешиваются в Python.
+"""
+from .models import Product, ProductPopularity
+
+
+def _override_key(row):
+    pk, sort_index, score, rating_avg = row
+    return (sort_index, score is None, -(score or 0), -rating_avg, pk)
+
+
+def popular_product_ids(limit):
+    """id первых limit популярных продуктов по порядку выдачи"""
+    # Продукты с ручным sort_index (их единицы) вместе с их очками
+    overrides = list(
+        Product.objects.exclude(sort_index=0).values_list(
+            "pk", "sort_index", "popularity__score", "rating_avg"
+        )
+    )
+    overrides.sort(key=_override_key)
+    override_ids = {row[0] for row in overrides}
+
+    # Верх рейтинга по индексу; переопределённые продукты из него выпадут
+    fetch = limit + len(override_ids)
+    ranked = list(
+        ProductPopularity.objects.order_by("-score", "product_id").values_list(
+            "product_id", flat=True
+        )[:fetch]
+    )
+    ids = [pk for pk in ranked if pk not in override_ids]
+    if len(ranked) < fetch and len(ids) < limit:
+        # Рейтинг прочитан целиком - добираю продукты без продаж
+        ids += (
+            Product.objects.filter(sort_index=0)
+            .exclude(pk__in=ranked)
+            .order_by("-rating_avg", "pk")
+            .values_list("pk", flat=True)[: limit - len(ids)]
+        )
+
+    before = [row[0] for row in overrides if row[1] < 0]
+    after = [row[0] for row in overrides if row[1] > 0]
+    return (before + ids[:limit] + after)[:limit]
@@ -0,0 +1,35 @@
+"""
+Отзывы продукта: страницы по дате и сводные показатели.
+
+Счётчик и средняя оценка хранятся в самом продукте (review_count,
+rating_avg), гистограмма оценок считается одним GROUP BY.
+"""
+from django.db.models import Count
+from .models import Review
+from .pagination import keyset_page
+from .serializers import ReviewSerializer
+
+
+def review_page(product, cursor, limit):
+    """Страница отзывов, новые первыми, и курсор следующей страницы"""
+    reviews = Review.objects.filter(products=product)
+    items, next_cursor = keyset_page(reviews, "date", True, cursor, limit)
+    return ReviewSerializer(items, many=True).data, next_cursor
+
+
+def review_stats(product):
+    """Число отзывов, средняя оценка и распределение оценок продукта"""
+    histogram = {str(rate): 0 for rate in range(0, 6)}
+    rates = (
+        Review.objects.filter(products=product)
+        .values("rate")
+        .annotate(count=Count("pk"))
+        .order_by()
+    )
+    for row in rates:
+        histogram[str(row["rate"])] = row["count"]
+    return {
+        "total": product.review_count,
+        "average": product.rating_avg,
+        "histogram": histogram,
+    }
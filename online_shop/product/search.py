@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity,
+)
+from django.db import connection
+from django.db.models import (
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+    TextField,
+    Value,
+)
+from django.db.models.functions import Coalesce
+from .models import Product, Tag
+
+
+def search_enabled():
+    """Полнотекстовый поиск есть только в PostgreSQL"""
+    return connection.vendor == "postgresql"
+
+
+def build_search_vector():
+    """Выражение поискового вектора: название, описание и имена тегов"""
+    config = settings.SEARCH_CONFIG
+    tag_names = (
+        Tag.objects.filter(products=OuterRef("pk"))
+        .values("products")
+        .annotate(names=StringAgg("name", " "))
+        .values("names")
+    )
+    return (
+        SearchVector("title", weight="A", config=config)
+        + SearchVector("description", weight="B", config=config)
+        + SearchVector(
+            Coalesce(
+                Subquery(tag_names), Value(""), output_field=TextField()
+            ),
+            weight="C",
+            config=config,
+        )
+    )
+
+
+def update_search_vectors(product_ids=None):
+    """Пересчитывает поисковые векторы (всех продуктов, если ids нет)"""
+    if not search_enabled():
+        return 0
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    return products.update(search_vector=build_search_vector())
+
+
+def search_products(queryset, text):
+    """
+    Фильтрует продукты по строке поиска и аннотирует их полем rank.
+
+    В PostgreSQL ищет по поисковому вектору (GIN-индекс) и, чтобы прощать
+    опечатки, по триграммному сходству названия (индекс gin_trgm_ops).
+    В остальных СУБД (SQLite в тестах) остаётся поиск по вхождению.
+    """
+    if not search_enabled():
+        return queryset.filter(title__icontains=text).annotate(
+            rank=Value(0.0, output_field=FloatField())
+        )
+    query = SearchQuery(
+        text, search_type="websearch", config=settings.SEARCH_CONFIG
+    )
+    return queryset.filter(
+        Q(search_vector=query) | Q(title__trigram_similar=text)
+    ).annotate(
+        rank=SearchRank(F("search_vector"), query)
+        + TrigramSimilarity("title", text)
+    )
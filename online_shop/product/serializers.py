@@ -45,7 +45,8 @@ class ReviewSerializer(serializers.Serializer):
     author = serializers.CharField()
     email = serializers.EmailField()
     text = serializers.CharField()
-    rate = serializers.IntegerField()
+    rate = serializers.IntegerField(min_value=0, max_value=5)
+    date = serializers.DateTimeField(read_only=True)
 
 
 class SpecificationSerializer(serializers.Serializer):
@@ -58,6 +59,7 @@ class SpecificationSerializer(serializers.Serializer):
 class ProductShortSerializer(serializers.ModelSerializer):
     """Сериализатор продукта"""
 
+    price = serializers.ReadOnlyField(source="effective_price")
     images = ImageSerializer(many=True)
     tags = TagSerializer(many=True)
 
@@ -82,9 +84,9 @@ class ProductShortSerializer(serializers.ModelSerializer):
 class ProductFullSerializer(serializers.ModelSerializer):
     """Полный сериализатор продукта"""
 
+    price = serializers.ReadOnlyField(source="effective_price")
     images = ImageSerializer(many=True)
     tags = TagSerializer(many=True)
-    reviews = ReviewSerializer(many=True, required=False)
     specifications = SpecificationSerializer(many=True, required=False)
 
     class Meta:
@@ -101,7 +103,6 @@ class ProductFullSerializer(serializers.ModelSerializer):
             "freeDelivery",
             "images",
             "tags",
-            "reviews",
             "specifications",
             "rating",
         ]
@@ -110,8 +111,13 @@ class ProductFullSerializer(serializers.ModelSerializer):
 class SaleItemSerializer(serializers.ModelSerializer):
     """Сериализатор акции"""
 
-    images = ImageSerializer(many=True)
     id = serializers.IntegerField(source="product.id")
+    title = serializers.ReadOnlyField(source="product.title")
+    price = serializers.ReadOnlyField(source="product.standart_price")
+    images = ImageSerializer(many=True, source="product.images")
+    # Фронт показывает даты акций в формате MM-DD
+    dateFrom = serializers.DateField(format="%m-%d")
+    dateTo = serializers.DateField(format="%m-%d")
 
     class Meta:
         model = SaleItem
@@ -0,0 +1,267 @@
+from django.db.models import Count, Sum
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from user.models import Image
+from .cache import bump_generation_on_commit
+from .categories import invalidate_category_tree
+from .models import Category, CategoryTag, Product, Review, SaleItem, Tag
+from .search import update_search_vectors
+
+
+@receiver(pre_save, sender=SaleItem)
+def remember_sale_product(sender, instance, **kwargs):
+    """Запоминаю прежний продукт акции, чтобы пересчитать и его цену"""
+    instance._previous_product_id = None
+    if instance.pk:
+        instance._previous_product_id = (
+            SaleItem.objects.filter(pk=instance.pk)
+            .values_list("product_id", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=SaleItem)
+@receiver(post_delete, sender=SaleItem)
+def refresh_sale_price(sender, instance, **kwargs):
+    """Пересчитываю effective_price продуктов, затронутых акцией"""
+    product_ids = {instance.product_id}
+    previous = getattr(instance, "_previous_product_id", None)
+    if previous:
+        product_ids.add(previous)
+    Product.objects.filter(pk__in=product_ids).refresh_prices()
+
+    # Обновляю цену и у загруженного в память продукта
+    if SaleItem.product.is_cached(instance):
+        try:
+            instance.product.refresh_from_db(fields=["effective_price"])
+        except Product.DoesNotExist:
+            pass
+
+
+SEARCH_FIELDS = {"title", "description"}
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_search(sender, instance, update_fields=None, **kwargs):
+    """Пересчитываю поисковый вектор после изменения продукта"""
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    update_search_vectors([instance.pk])
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def refresh_tagged_search(sender, instance, action, reverse, pk_set, **kwargs):
+    """Пересчитываю поисковые векторы при изменении тегов продукта"""
+    if action == "pre_clear" and reverse:
+        instance._cleared_product_ids = list(
+            instance.products.values_list("pk", flat=True)
+        )
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        update_search_vectors([instance.pk])
+    elif action == "post_clear":
+        update_search_vectors(getattr(instance, "_cleared_product_ids", []))
+    else:
+        update_search_vectors(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def refresh_tag_search(sender, instance, created, **kwargs):
+    """Переименование тега меняет векторы всех его продуктов"""
+    if not created:
+        update_search_vectors(instance.products.values("pk"))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_products(sender, instance, **kwargs):
+    instance._deleted_product_ids = list(
+        instance.products.values_list("pk", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+def refresh_deleted_tag_search(sender, instance, **kwargs):
+    update_search_vectors(getattr(instance, "_deleted_product_ids", []))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def refresh_category_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    """Пересчитываю наборы тегов категорий изменённых продуктов"""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        category_ids = {instance.category_id}
+    else:
+        if action == "post_clear":
+            pk_set = getattr(instance, "_cleared_product_ids", [])
+        category_ids = set(
+            Product.objects.filter(pk__in=pk_set).values_list(
+                "category_id", flat=True
+            )
+        )
+    CategoryTag.objects.rebuild(category_ids)
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_category(sender, instance, update_fields=None, **kwargs):
+    """Запоминаю прежнюю категорию, чтобы перенести теги продукта"""
+    instance._previous_category_id = None
+    if instance.pk and (update_fields is None or "category" in update_fields):
+        instance._previous_category_id = (
+            Product.objects.filter(pk=instance.pk)
+            .values_list("category_id", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def move_category_tags(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_previous_category_id", None)
+    if previous is not None and previous != instance.category_id:
+        CategoryTag.objects.rebuild({previous, instance.category_id})
+
+
+@receiver(post_delete, sender=Product)
+def refresh_deleted_product_tags(sender, instance, **kwargs):
+    """Связи удалённого продукта с тегами удаляются каскадом"""
+    CategoryTag.objects.rebuild({instance.category_id})
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def refresh_category_tree(sender, **kwargs):
+    """Дерево категорий зависит только от категорий и их изображений"""
+    invalidate_category_tree()
+
+
+REVIEW_STATS_FIELDS = [
+    "review_count",
+    "review_rate_sum",
+    "rating_avg",
+    "rating",
+]
+
+
+@receiver(m2m_changed, sender=Product.reviews.through)
+def update_review_stats(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Обновляю счётчики отзывов продукта в той же транзакции, в которой
+    отзыв привязывается к продукту или отвязывается от него.
+    """
+    if action == "pre_clear" and reverse:
+        instance._cleared_product_ids = list(
+            instance.products.values_list("pk", flat=True)
+        )
+        return
+    if action == "post_clear":
+        if reverse:
+            product_ids = getattr(instance, "_cleared_product_ids", [])
+        else:
+            product_ids = [instance.pk]
+        Product.objects.filter(pk__in=product_ids).refresh_review_stats()
+    elif action in ("post_add", "post_remove"):
+        sign = 1 if action == "post_add" else -1
+        if reverse:
+            products = Product.objects.filter(pk__in=pk_set)
+            count, rate_sum = 1, instance.rate
+        else:
+            products = Product.objects.filter(pk=instance.pk)
+            stats = Review.objects.filter(pk__in=pk_set).aggregate(
+                count=Count("pk"), rate_sum=Sum("rate")
+            )
+            count, rate_sum = stats["count"], stats["rate_sum"] or 0
+        products.add_review_stats(sign * count, sign * rate_sum)
+    else:
+        return
+
+    # Чтобы последующий save() продукта не затёр счётчики старыми значениями
+    if not reverse:
+        instance.refresh_from_db(fields=REVIEW_STATS_FIELDS)
+
+
+@receiver(post_save, sender=Review)
+def refresh_changed_review_stats(sender, instance, created, **kwargs):
+    """Изменённая оценка отзыва пересчитывает средние его продуктов"""
+    if not created:
+        Product.objects.filter(reviews=instance).refresh_review_stats()
+
+
+@receiver(pre_delete, sender=Review)
+def remember_review_products(sender, instance, **kwargs):
+    instance._deleted_product_ids = list(
+        instance.products.values_list("pk", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Review)
+def refresh_deleted_review_stats(sender, instance, **kwargs):
+    """Связи удалённого отзыва удаляются каскадом, без m2m_changed"""
+    product_ids = getattr(instance, "_deleted_product_ids", [])
+    Product.objects.filter(pk__in=product_ids).refresh_review_stats()
+
+
+CATALOG_MODELS = (Product, SaleItem, Category, Tag, Image, Review)
+CATALOG_RELATIONS = (
+    Product.images.through,
+    Product.tags.through,
+    Product.reviews.through,
+    Product.specifications.through,
+)
+
+
+def changed_product_ids(
+    sender, instance, action=None, reverse=False, **kwargs
+):
+    """
+    Какие продукты затронуты изменением (для журнала снимка каталога).
+    None - неизвестно, снимок придётся собрать целиком.
+    """
+    if action is not None:
+        if not reverse:
+            return {instance.pk}
+        if action == "post_clear":
+            return getattr(instance, "_cleared_product_ids", None)
+        return kwargs["pk_set"]
+    if sender is Product:
+        return {instance.pk}
+    if sender is SaleItem:
+        return {
+            instance.product_id,
+            getattr(instance, "_previous_product_id", None),
+        } - {None}
+    if sender is Review:
+        if "created" not in kwargs:
+            return getattr(instance, "_deleted_product_ids", None)
+        if kwargs["created"]:
+            return set()
+        return set(instance.products.values_list("pk", flat=True))
+    if sender is Tag and "created" not in kwargs:
+        # Связи удалённого тега исчезают каскадом
+        return None
+    # Категории, изображения и переименования тегов колонки снимка не меняют
+    return set()
+
+
+def invalidate_catalog(sender, **kwargs):
+    """Любое изменение данных каталога сбрасывает кэш ответов"""
+    action = kwargs.get("action")
+    if action is not None and not action.startswith("post_"):
+        return
+    bump_generation_on_commit(changed_product_ids(sender, **kwargs))
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog, sender=model)
+    post_delete.connect(invalidate_catalog, sender=model)
+for relation in CATALOG_RELATIONS:
+    m2m_changed.connect(invalidate_catalog, sender=relation)
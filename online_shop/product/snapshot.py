@@ -0,0 +1,250 @@
+"""
+Колоночный снимок каталога.
+
+Колонки, по которым каталог фильтрует и сортирует продукты, выгружаются
+в массивы NumPy (по файлу .npy на колонку) и открываются через mmap:
+все воркеры читают одни и те же страницы page cache, не копируя данные
+и не обращаясь к базе. Принадлежность продуктов тегам хранится битовыми
+масками, порядок для каждой сортировки - заранее посчитанной перестановкой,
+поэтому отбор страницы - несколько векторных операций без сортировки.
+
+Снимок помечен поколением каталога (см. cache.py) и используется, только
+пока поколение совпадает; иначе вьюха идёт в ORM. Пересобирает снимок
+команда build_catalog_snapshot, перечитывая из базы лишь продукты,
+изменённые с прошлой сборки.
+"""
+import datetime
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from .cache import get_changes, get_generation
+from .models import Product
+
+COLUMNS = {
+    "id": np.int64,
+    "effective_price": np.float64,
+    "count": np.int64,
+    "freeDelivery": np.bool_,
+    "category_id": np.int64,
+    "rating_avg": np.float64,
+    "review_count": np.int64,
+    "date": np.int64,
+}
+SORT_FIELDS = ("effective_price", "rating_avg", "review_count", "date")
+LINK_COLUMNS = ("link_product", "link_tag")
+CURRENT_FILE = "CURRENT"
+# При большем числе изменений дешевле перечитать каталог целиком
+INCREMENTAL_LIMIT = 5000
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+class CatalogSnapshot:
+    """Открытый только на чтение снимок каталога"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        meta = json.loads((self.path / "meta.json").read_text())
+        self.generation = meta["generation"]
+
+        def load(name):
+            return np.load(self.path / f"{name}.npy", mmap_mode="r")
+
+        self.columns = {name: load(name) for name in COLUMNS}
+        self.links = {name: load(name) for name in LINK_COLUMNS}
+        self.orders = {field: load(f"order_{field}") for field in SORT_FIELDS}
+        self.tag_ids = load("tag_ids")
+        self.tag_bitmap = load("tag_bitmap")
+        self.size = len(self.columns["id"])
+
+    def supports(self, filters, sort_field):
+        """Полнотекстовый поиск и сортировка по релевантности - только в ORM"""
+        return not filters["name"] and sort_field in SORT_FIELDS
+
+    def select(self, filters, sort_field, descending, offset, limit):
+        """
+        Возвращает id продуктов страницы (в порядке выдачи) и общее число
+        подходящих продуктов. Порядок совпадает с ORDER BY (ключ, id).
+        """
+        columns = self.columns
+        mask = np.ones(self.size, dtype=bool)
+        if filters["min_price"] is not None:
+            mask &= columns["effective_price"] >= filters["min_price"]
+        if filters["max_price"] is not None:
+            mask &= columns["effective_price"] <= filters["max_price"]
+        if filters["free_delivery"]:
+            mask &= columns["freeDelivery"]
+        if filters["available"]:
+            mask &= columns["count"] > 0
+        if filters["categories"]:
+            mask &= np.isin(columns["category_id"], filters["categories"])
+        if filters["tags"]:
+            mask &= self._tagged(
+                {int(tag) for tag in filters["tags"]},
+                filters["tags_match_all"],
+            )
+
+        order = self.orders[sort_field]
+        if descending:
+            order = order[::-1]
+        matched = order[mask[order]]
+        page = columns["id"][matched[offset : offset + limit]]
+        return page.tolist(), len(matched)
+
+    def _tagged(self, tags, match_all):
+        """Маска продуктов, у которых есть любой (или каждый) из тегов"""
+        tags = np.fromiter(tags, dtype=np.int64)
+        positions = np.searchsorted(self.tag_ids, tags)
+        found = positions < len(self.tag_ids)
+        found[found] = self.tag_ids[positions[found]] == tags[found]
+        if not found.any() or (match_all and not found.all()):
+            return np.zeros(self.size, dtype=bool)
+        combine = np.bitwise_and if match_all else np.bitwise_or
+        bits = combine.reduce(self.tag_bitmap[positions[found]], axis=0)
+        return np.unpackbits(bits, count=self.size, bitorder="little").view(
+            bool
+        )
+
+
+_loaded = None
+
+
+def load_snapshot(directory=None):
+    """Открывает текущий снимок каталога (None, если его ещё нет)"""
+    global _loaded
+    directory = Path(directory or settings.CATALOG_SNAPSHOT_DIR)
+    try:
+        name = (directory / CURRENT_FILE).read_text().strip()
+    except FileNotFoundError:
+        return None
+    path = directory / name
+    if _loaded is None or _loaded.path != path:
+        try:
+            _loaded = CatalogSnapshot(path)
+        except FileNotFoundError:
+            return None
+    return _loaded
+
+
+def current_snapshot():
+    """Снимок, соответствующий текущему поколению каталога, или None"""
+    snapshot = load_snapshot()
+    if snapshot is None or snapshot.generation != get_generation():
+        return None
+    return snapshot
+
+
+def _read_rows(products):
+    rows = products.order_by("pk").values_list(*COLUMNS)
+    data = {name: [] for name in COLUMNS}
+    for row in rows.iterator(chunk_size=2000):
+        for name, value in zip(COLUMNS, row):
+            if name == "date":
+                value = (value - EPOCH) // MICROSECOND
+            data[name].append(value)
+    return {
+        name: np.array(values, dtype=COLUMNS[name])
+        for name, values in data.items()
+    }
+
+
+def _read_links(links):
+    pairs = links.values_list("product_id", "tag_id")
+    data = np.array(list(pairs.iterator(chunk_size=2000)), dtype=np.int64)
+    data = data.reshape(-1, 2)
+    return {"link_product": data[:, 0], "link_tag": data[:, 1]}
+
+
+def _merge(previous, changed):
+    """Берёт из старого снимка неизменённые строки и дочитывает остальные"""
+    changed_ids = np.array(sorted(changed), dtype=np.int64)
+    keep = ~np.isin(previous.columns["id"], changed_ids)
+    keep_links = ~np.isin(previous.links["link_product"], changed_ids)
+
+    rows = _read_rows(Product.objects.filter(pk__in=changed))
+    links = _read_links(
+        Product.tags.through.objects.filter(product_id__in=changed)
+    )
+    columns = {
+        name: np.concatenate([previous.columns[name][keep], rows[name]])
+        for name in COLUMNS
+    }
+    order = np.argsort(columns["id"], kind="stable")
+    columns = {name: column[order] for name, column in columns.items()}
+    links = {
+        name: np.concatenate([previous.links[name][keep_links], links[name]])
+        for name in LINK_COLUMNS
+    }
+    return columns, links
+
+
+def _tag_bitmap(ids, links):
+    """Битовая маска продуктов (по порядку строк) для каждого тега"""
+    present = np.isin(links["link_product"], ids)
+    products = links["link_product"][present]
+    tags = links["link_tag"][present]
+    tag_ids = np.unique(tags)
+    rows = np.searchsorted(ids, products)
+    bitmap = np.zeros((len(tag_ids), (len(ids) + 7) // 8), dtype=np.uint8)
+    np.bitwise_or.at(
+        bitmap,
+        (np.searchsorted(tag_ids, tags), rows >> 3),
+        (1 << (rows & 7)).astype(np.uint8),
+    )
+    return tag_ids, bitmap
+
+
+def build_snapshot(directory=None, previous=None):
+    """
+    Собирает новый снимок и атомарно делает его текущим.
+
+    Если передан previous и журнал изменений с его поколения полон,
+    из базы читаются только изменённые продукты.
+    """
+    directory = Path(directory or settings.CATALOG_SNAPSHOT_DIR)
+    generation = get_generation()
+    changed = None
+    if previous is not None:
+        # Поколение растёт после коммита, поэтому всё, что видел прошлый
+        # снимок, учтено не позже его поколения
+        changed = get_changes(
+            previous.generation, generation, INCREMENTAL_LIMIT
+        )
+    if changed is not None and len(changed) <= INCREMENTAL_LIMIT:
+        columns, links = _merge(previous, changed)
+    else:
+        columns = _read_rows(Product.objects.all())
+        links = _read_links(Product.tags.through.objects.all())
+
+    arrays = dict(columns)
+    arrays.update(links)
+    for field in SORT_FIELDS:
+        arrays[f"order_{field}"] = np.lexsort((columns["id"], columns[field]))
+    arrays["tag_ids"], arrays["tag_bitmap"] = _tag_bitmap(columns["id"], links)
+
+    name = f"{generation}-{uuid.uuid4().hex[:8]}"
+    directory.mkdir(parents=True, exist_ok=True)
+    staging = directory / f".{name}"
+    staging.mkdir()
+    for key, array in arrays.items():
+        np.save(staging / f"{key}.npy", array)
+    meta = {"generation": generation, "size": len(columns["id"])}
+    (staging / "meta.json").write_text(json.dumps(meta))
+    os.rename(staging, directory / name)
+
+    # Воркеры видят либо старый, либо новый указатель целиком
+    pointer = directory / f".{CURRENT_FILE}.{name}"
+    pointer.write_text(name)
+    os.replace(pointer, directory / CURRENT_FILE)
+
+    # Предыдущий снимок оставляю для воркеров, которые его ещё читают
+    keep = {name, previous.path.name if previous is not None else None}
+    for path in directory.iterdir():
+        if path.is_dir() and path.name not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+    return load_snapshot(directory)
@@ -1,8 +1,35 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import skipUnless
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from online_shop.queryplan import plan_queryset
+from online_shop.renderers import FastJSONRenderer
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework.test import APIClient
 from user.models import Image
+from product.cache import (
+    GENERATION_KEY,
+    bump_generation,
+    get_changes,
+    get_generation,
+    response_key,
+)
+from product.cards import product_cards, product_cards_by_id
+from product.snapshot import build_snapshot, current_snapshot
+from product.serializers import CategorySerializer, ProductShortSerializer
+from product.views import CatalogView
 from product.models import (
     Category,
+    CategoryTag,
     Product,
     Tag,
     Review,
@@ -59,8 +86,8 @@ class ProductTestBase(TestCase):
         cls.sale1 = SaleItem.objects.create(
             product=cls.product1,
             salePrice=100.00,
-            dateFrom="05-08",
-            dateTo="05-20",
+            dateFrom=timezone.localdate() - timedelta(days=1),
+            dateTo=timezone.localdate() + timedelta(days=10),
         )
         cls.product1.tags.add(cls.tag1)
         cls.product1.reviews.add(cls.review1, cls.review2)
@@ -70,6 +97,10 @@ class ProductTestBase(TestCase):
         cls.product2.tags.add(cls.tag2)
         cls.product2.images.add(cls.image)
 
+    def setUp(self):
+        # Откат транзакции теста не сбрасывает кэш ответов
+        cache.clear()
+
 
 class CategoryListViewTest(TestCase):
     def setUp(self):
@@ -151,6 +182,20 @@ class CatalogViewTest(ProductTestBase):
             response.data["items"][0]["title"], "Тестовая клава 1"
         )
 
+    def test_catalog_filter_by_all_tags(self):
+        """
+        Тестирование фильтра по тегам в режимах any и all.
+        """
+        self.product1.tags.add(self.tag2)
+        url = f"/api/catalog?tags[]={self.tag1.id}&tags[]={self.tag2.id}"
+        response = self.client.get(url)
+        self.assertEqual(response.data["total"], 2)
+        response = self.client.get(url + "&tagsMode=all")
+        self.assertEqual(
+            [item["id"] for item in response.data["items"]],
+            [self.product1.id],
+        )
+
     def test_catalog_pagination(self):
         """
         Тестирование пагинации каталога.
@@ -159,6 +204,599 @@ class CatalogViewTest(ProductTestBase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data["items"]), 1)
         self.assertEqual(response.data["currentPage"], 2)
+        self.assertEqual(response.data["total"], 2)
+        self.assertEqual(response.data["countMode"], "exact")
+
+    @override_settings(CATALOG_EXACT_COUNT_LIMIT=1)
+    def test_catalog_capped_count(self):
+        """
+        Тестирование обрезанного подсчёта на большой выдаче.
+        """
+        response = self.client.get("/api/catalog?limit=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(response.data["countMode"], ("estimate", "capped"))
+        self.assertGreaterEqual(response.data["lastPage"], 2)
+
+    def test_catalog_cursor_pagination(self):
+        """
+        Тестирование курсорной пагинации каталога.
+        """
+        for sort in ("date", "price", "rating", "reviews"):
+            titles = []
+            cursor = ""
+            while cursor is not None:
+                response = self.client.get(
+                    "/api/catalog",
+                    {"limit": 1, "sort": sort, "cursor": cursor},
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn("lastPage", response.data)
+                titles += [item["title"] for item in response.data["items"]]
+                cursor = response.data["nextCursor"]
+            self.assertCountEqual(
+                titles, [self.product1.title, self.product2.title]
+            )
+
+    def test_catalog_cursor_matches_pages(self):
+        """
+        Тестирование совпадения порядка курсорной и обычной пагинации.
+        """
+        pages = [
+            self.client.get(
+                "/api/catalog",
+                {"limit": 1, "currentPage": page, "sort": "rating"},
+            ).data["items"][0]["id"]
+            for page in (1, 2)
+        ]
+        first = self.client.get(
+            "/api/catalog", {"limit": 1, "sort": "rating", "cursor": ""}
+        )
+        second = self.client.get(
+            "/api/catalog",
+            {
+                "limit": 1,
+                "sort": "rating",
+                "cursor": first.data["nextCursor"],
+            },
+        )
+        self.assertEqual(
+            [first.data["items"][0]["id"], second.data["items"][0]["id"]],
+            pages,
+        )
+
+    def test_catalog_invalid_cursor(self):
+        """
+        Тестирование повреждённого курсора.
+        """
+        response = self.client.get("/api/catalog?cursor=broken")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.data)
+
+
+class EffectivePriceTest(ProductTestBase):
+    def test_price_follows_sales(self):
+        """
+        Тестирование пересчёта итоговой цены при изменении акций.
+        """
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.effective_price, 100)
+
+        self.sale1.salePrice = 90
+        self.sale1.save()
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.effective_price, 90)
+
+        self.sale1.delete()
+        self.product1.refresh_from_db()
+        self.assertEqual(
+            self.product1.effective_price, self.product1.standart_price
+        )
+
+    def test_catalog_filters_by_sale_price(self):
+        """
+        Тестирование фильтрации каталога по цене с учётом скидки.
+        """
+        response = self.client.get("/api/catalog?filter[maxPrice]=100")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["items"]), 2)
+        self.assertEqual(response.data["items"][0]["price"], 100)
+
+
+class CatalogFacetsTest(ProductTestBase):
+    def test_catalog_facets(self):
+        """
+        Тестирование фасетов каталога вместе со страницей товаров.
+        """
+        response = self.client.get("/api/catalog?facets=true")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["items"]), 2)
+        facets = response.data["facets"]
+        self.assertEqual(facets["total"], 2)
+        self.assertEqual(facets["price"]["min"], 100)
+        self.assertEqual(facets["price"]["max"], 100)
+        self.assertEqual(facets["freeDelivery"], 1)
+        self.assertEqual(facets["available"], 2)
+        self.assertCountEqual(
+            [(tag["name"], tag["count"]) for tag in facets["tags"]],
+            [("Игровой", 1), ("Офисный", 1)],
+        )
+
+    def test_catalog_facets_follow_filters(self):
+        """
+        Тестирование фасетов с фильтром по тегу.
+        """
+        response = self.client.get(
+            f"/api/catalog?facets=true&tags[]={self.tag1.id}"
+        )
+        facets = response.data["facets"]
+        self.assertEqual(facets["total"], 1)
+        self.assertEqual(facets["freeDelivery"], 1)
+        self.assertEqual([tag["name"] for tag in facets["tags"]], ["Игровой"])
+
+    def test_catalog_without_facets(self):
+        """
+        Тестирование каталога без запроса фасетов.
+        """
+        response = self.client.get("/api/catalog")
+        self.assertNotIn("facets", response.data)
+
+
+class CatalogSearchTest(ProductTestBase):
+    def test_search_with_cursor(self):
+        """
+        Тестирование поиска с сортировкой по релевантности и курсором.
+        """
+        response = self.client.get(
+            "/api/catalog", {"filter[name]": "Тестов", "cursor": ""}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["items"]), 2)
+
+    @skipUnless(connection.vendor == "postgresql", "requires PostgreSQL")
+    def test_search_tolerates_typos(self):
+        """
+        Тестирование поиска по описанию, тегам и с опечаткой.
+        """
+        for name in ("монитр", "Игровой", "монитор"):
+            response = self.client.get("/api/catalog", {"filter[name]": name})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.data["items"][0]["title"], self.product1.title
+            )
+
+
+class ResponseCacheTest(ProductTestBase):
+    def test_cached_response_skips_database(self):
+        """
+        Тестирование повторного ответа каталога из кэша.
+        """
+        first = self.client.get("/api/catalog?sort=price&limit=5")
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get("/api/catalog?limit=5&sort=price")
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(first.data, second.data)
+
+    def test_cache_invalidated_on_change(self):
+        """
+        Тестирование сброса кэша при изменении продукта и тегов.
+        """
+        self.client.get("/api/tags")
+        # Поколение каталога растёт после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name="Новый")
+        response = self.client.get("/api/tags")
+        self.assertIn("Новый", [tag["name"] for tag in response.data])
+
+        self.client.get("/api/products/limited")
+        self.product1.limitedEdition = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product1.save()
+        response = self.client.get("/api/products/limited")
+        self.assertEqual(len(response.data), 2)
+
+    def test_stale_copy_served_during_rebuild(self):
+        """
+        Тестирование отдачи устаревшей копии, пока ответ перестраивает
+        другой воркер.
+        """
+        response = self.client.get("/api/banners")
+        lock_key = response_key(Request(response.wsgi_request)) + ":lock"
+        Product.objects.filter(pk=self.product1.pk).update(title="Новое")
+        bump_generation()
+
+        # Блокировку перестройки держит другой воркер
+        cache.add(lock_key, 1)
+        response = self.client.get("/api/banners")
+        titles = [product["title"] for product in response.data]
+        self.assertIn(self.product1.title, titles)
+
+        cache.delete(lock_key)
+        response = self.client.get("/api/banners")
+        titles = [product["title"] for product in response.data]
+        self.assertIn("Новое", titles)
+
+    def test_stale_copy_not_revalidated(self):
+        """
+        Тестирование того, что устаревшая копия получает ETag своего
+        поколения и при перепроверке не подтверждается 304.
+        """
+        response = self.client.get("/api/banners")
+        old_etag = response["ETag"]
+        lock_key = response_key(Request(response.wsgi_request)) + ":lock"
+        Product.objects.filter(pk=self.product1.pk).update(title="Новое")
+        bump_generation()
+
+        cache.add(lock_key, 1)
+        response = self.client.get("/api/banners")
+        self.assertNotIn("Новое", [item["title"] for item in response.data])
+        self.assertEqual(response["ETag"], old_etag)
+        response = self.client.get("/api/banners", HTTP_IF_NONE_MATCH=old_etag)
+        self.assertEqual(response.status_code, 200)
+
+        cache.delete(lock_key)
+        response = self.client.get("/api/banners", HTTP_IF_NONE_MATCH=old_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Новое", [item["title"] for item in response.data])
+        new_etag = response["ETag"]
+        self.assertNotEqual(new_etag, old_etag)
+        response = self.client.get("/api/banners", HTTP_IF_NONE_MATCH=new_etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class ConditionalGetTest(ProductTestBase):
+    def test_not_modified_by_etag(self):
+        """
+        Тестирование ответа 304 на совпадающий If-None-Match.
+        """
+        response = self.client.get("/api/categories")
+        etag = response["ETag"]
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/categories", HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+    def test_not_modified_since(self):
+        """
+        Тестирование ответа 304 на If-Modified-Since.
+        """
+        url = f"/api/catalog?category={self.category.id}"
+        response = self.client.get(url)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_edits_change_validators(self):
+        """
+        Тестирование смены ETag после изменения продукта и категории.
+        """
+        url = f"/api/product/{self.product1.id}"
+        etag = self.client.get(url)["ETag"]
+
+        self.product1.title = "Новое название"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product1.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["title"], "Новое название")
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = self.client.get("/api/categories")["ETag"]
+        self.category.title = "Техника"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        response = self.client.get("/api/categories", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_errors_without_validators(self):
+        """
+        Тестирование отсутствия ETag у ответа с ошибкой.
+        """
+        response = self.client.get("/api/product/0")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header("ETag"))
+
+
+class CategoryTreeTest(ProductTestBase):
+    def setUp(self):
+        super().setUp()
+        self.sub_image = Image.objects.create(src="images/sub.png", alt="sub")
+        self.subcategory = Category.objects.create(
+            title="Мониторы", image=self.sub_image, parent=self.category
+        )
+        Category.objects.create(title="Без картинки")
+        self.product2.category = self.subcategory
+        self.product2.save()
+
+    def test_tree_matches_serializer(self):
+        """
+        Тестирование дерева категорий: один запрос и прежний формат.
+        """
+        expected = CategorySerializer(
+            Category.objects.filter(parent__isnull=True).order_by("pk"),
+            many=True,
+        ).data
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/categories")
+        self.assertEqual(response.data, expected)
+
+        cache.delete(response_key(Request(response.wsgi_request)))
+        with self.assertNumQueries(0):
+            self.client.get("/api/categories")
+
+    def test_tree_invalidated_by_image_change(self):
+        """
+        Тестирование сброса дерева после изменения изображения.
+        """
+        self.client.get("/api/categories")
+        self.sub_image.alt = "новая подпись"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sub_image.save()
+        response = self.client.get("/api/categories")
+        subcategory = response.data[0]["subcategories"][0]
+        self.assertEqual(subcategory["image"]["alt"], "новая подпись")
+
+    def test_catalog_includes_subcategories(self):
+        """
+        Тестирование фильтра каталога по родительской категории.
+        """
+        response = self.client.get(f"/api/catalog?category={self.category.id}")
+        self.assertEqual(response.data["total"], 2)
+        response = self.client.get(
+            f"/api/catalog?category={self.subcategory.id}"
+        )
+        self.assertEqual(
+            [item["id"] for item in response.data["items"]],
+            [self.product2.id],
+        )
+        response = self.client.get(f"/api/tags?category={self.category.id}")
+        self.assertEqual(
+            sorted(tag["name"] for tag in response.data),
+            ["Игровой", "Офисный"],
+        )
+
+
+class QueryPlanTest(ProductTestBase):
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_catalog_queries_do_not_depend_on_page_size(self):
+        """
+        Тестирование постоянного числа запросов каталога.
+        """
+        self.assertEqual(
+            self.count_queries("/api/catalog?limit=1"),
+            self.count_queries("/api/catalog?limit=2"),
+        )
+
+    def test_categories_queries_do_not_depend_on_size(self):
+        """
+        Тестирование постоянного числа запросов списка категорий.
+        """
+        before = self.count_queries("/api/categories")
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                Category.objects.create(
+                    title=f"Sub {i}", image=self.image, parent=self.category
+                )
+        self.assertEqual(self.count_queries("/api/categories"), before)
+
+
+class CatalogSnapshotTest(ProductTestBase):
+    QUERIES = [
+        "/api/catalog",
+        "/api/catalog?sort=price&sortType=inc",
+        "/api/catalog?sort=rating&limit=2&currentPage=2",
+        "/api/catalog?sort=reviews&filter[available]=true",
+        "/api/catalog?filter[minPrice]=50&filter[maxPrice]=110",
+        "/api/catalog?filter[freeDelivery]=true&sort=price",
+        "/api/catalog?tags[]={tag1}&tags[]={tag2}&tags[]=999",
+        "/api/catalog?tags[]={tag1}&tags[]={tag2}&tagsMode=all",
+        "/api/catalog?tags[]={tag1}&tags[]=999&tagsMode=all",
+        "/api/catalog?category={category}&sort=date&sortType=inc",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(
+            CATALOG_SNAPSHOT_DIR=self.directory.name
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for i in range(5):
+            product = Product.objects.create(
+                category=self.category,
+                title=f"Товар {i}",
+                standart_price=50 + i * 10,
+                count=i % 2,
+                description="Короткое описание",
+                fullDescription="Полное описание",
+                freeDelivery=i % 2 == 0,
+                rating=i % 3 + 2,
+            )
+            product.tags.add(self.tag1 if i % 2 else self.tag2)
+            if i > 2:
+                product.tags.add(self.tag1, self.tag2)
+
+    def responses(self):
+        cache.clear()
+        ids = {
+            "tag1": self.tag1.id,
+            "tag2": self.tag2.id,
+            "category": self.category.id,
+        }
+        return [
+            self.client.get(url.format(**ids)).data for url in self.QUERIES
+        ]
+
+    def test_snapshot_matches_orm(self):
+        """
+        Тестирование совпадения выдачи из снимка с выдачей ORM.
+        """
+        expected = self.responses()
+        call_command("build_catalog_snapshot", stdout=StringIO())
+        snapshot = current_snapshot()
+        self.assertIsNotNone(snapshot)
+        self.assertEqual(snapshot.size, Product.objects.count())
+        self.assertEqual(self.responses(), expected)
+
+    def test_snapshot_rebuilt_incrementally(self):
+        """
+        Тестирование устаревания снимка и его инкрементальной пересборки.
+        """
+        snapshot = build_snapshot()
+        # Снимок устаревает только после коммита изменений
+        with self.captureOnCommitCallbacks(execute=True):
+            SaleItem.objects.create(
+                product=self.product2,
+                salePrice=1,
+                dateFrom=timezone.localdate() - timedelta(days=1),
+                dateTo=timezone.localdate() + timedelta(days=10),
+            )
+            self.product1.tags.clear()
+            self.assertIs(current_snapshot(), snapshot)
+        self.assertIsNone(current_snapshot())
+
+        with CaptureQueriesContext(connection) as ctx:
+            snapshot = build_snapshot(previous=snapshot)
+        self.assertTrue(
+            all("IN" in query["sql"] for query in ctx.captured_queries)
+        )
+        self.assertIs(current_snapshot(), snapshot)
+        ids, total = snapshot.select(
+            CatalogView().parse_filters(QueryDict(f"tags[]={self.tag1.id}")),
+            "effective_price",
+            False,
+            0,
+            20,
+        )
+        self.assertNotIn(self.product1.id, ids)
+        self.assertEqual(total, Product.objects.filter(tags=self.tag1).count())
+
+        expected = self.responses()
+        full = build_snapshot()
+        self.assertEqual(full.size, snapshot.size)
+        self.assertEqual(self.responses(), expected)
+
+    def test_snapshot_rebuilt_fully_after_counter_evicted(self):
+        """
+        Тестирование полной пересборки снимка, когда счётчик поколений был
+        вытеснен и начат заново с текущего времени.
+        """
+        snapshot = build_snapshot()
+        cache.incr(GENERATION_KEY, 10**7)
+        self.assertIsNone(
+            get_changes(snapshot.generation, get_generation(), 10)
+        )
+
+        with CaptureQueriesContext(connection) as ctx:
+            snapshot = build_snapshot(previous=snapshot)
+        self.assertFalse(
+            any("IN" in query["sql"] for query in ctx.captured_queries)
+        )
+        self.assertIs(current_snapshot(), snapshot)
+        self.assertEqual(snapshot.size, Product.objects.count())
+
+
+class ProductCardsTest(ProductTestBase):
+    def setUp(self):
+        super().setUp()
+        extra = Image.objects.create(src="", alt="без файла")
+        self.product1.images.add(extra)
+        self.product2.tags.add(self.tag1)
+        self.product1.title = 'Монитор \u2028 27"'
+        self.product1.save()
+
+    def test_cards_match_serializer(self):
+        """
+        Тестирование совпадения быстрых карточек с сериализатором.
+        """
+        products = Product.objects.order_by("id")
+        expected = ProductShortSerializer(
+            plan_queryset(products, ProductShortSerializer), many=True
+        ).data
+        cards = product_cards(products)
+        self.assertEqual(cards, expected)
+        self.assertEqual(
+            FastJSONRenderer().render({"items": cards}),
+            JSONRenderer().render({"items": expected}),
+        )
+
+    def test_cards_by_id_keep_order(self):
+        """
+        Тестирование порядка карточек по списку id.
+        """
+        ids = [self.product2.id, 0, self.product1.id]
+        cards = product_cards_by_id(ids)
+        self.assertEqual(
+            [card["id"] for card in cards],
+            [self.product2.id, self.product1.id],
+        )
+
+    def test_benchmark_command(self):
+        """
+        Тестирование команды замера стоимости карточки.
+        """
+        out = StringIO()
+        call_command(
+            "benchmark_product_cards", repeat=1, stdout=out, stderr=out
+        )
+        self.assertIn("us per card", out.getvalue())
+        self.assertNotIn("differ", out.getvalue())
+
+
+class ReviewStatsTest(ProductTestBase):
+    def test_stats_follow_reviews(self):
+        """
+        Тестирование пересчёта счётчиков при добавлении и удалении отзывов.
+        """
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.review_count, 2)
+        self.assertEqual(self.product1.rating_avg, Decimal("4.5"))
+
+        self.client.post(
+            f"/api/product/{self.product1.id}/reviews",
+            {"author": "A", "email": "a@mail.com", "text": "ок", "rate": 3},
+            format="json",
+        )
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.review_count, 3)
+        self.assertEqual(self.product1.rating_avg, 4)
+        self.assertEqual(self.product1.rating, 4)
+
+        self.review1.delete()
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.review_count, 2)
+        self.assertEqual(self.product1.rating_avg, Decimal("3.5"))
+
+    def test_rebuild_command(self):
+        """
+        Тестирование команды полного пересчёта счётчиков.
+        """
+        Product.objects.update(review_count=0, review_rate_sum=0)
+        call_command("rebuild_review_stats", stdout=StringIO())
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.review_count, 2)
+        self.assertEqual(self.product1.review_rate_sum, 9)
+
+    def test_catalog_sort_by_reviews(self):
+        """
+        Тестирование сортировки каталога по числу отзывов.
+        """
+        response = self.client.get("/api/catalog?sort=reviews")
+        self.assertEqual(
+            [item["id"] for item in response.data["items"]],
+            [self.product1.id, self.product2.id],
+        )
 
 
 class ProductsPopularViewTest(ProductTestBase):
@@ -201,6 +839,52 @@ class SalesViewTest(ProductTestBase):
         self.assertIn("dateFrom", sale)
         self.assertIn("dateTo", sale)
         self.assertIn("images", sale)
+        self.assertEqual(
+            sale["dateFrom"], self.sale1.dateFrom.strftime("%m-%d")
+        )
+        self.assertEqual(sale["title"], self.product1.title)
+
+    def test_only_active_sales(self):
+        """
+        Тестирование того, что истёкшие и будущие акции не действуют.
+        """
+        today = timezone.localdate()
+        for start, end in ((-10, -1), (1, 10)):
+            SaleItem.objects.create(
+                product=self.product2,
+                salePrice=1,
+                dateFrom=today + timedelta(days=start),
+                dateTo=today + timedelta(days=end),
+            )
+        response = self.client.get("/api/sales")
+        self.assertEqual(response.data["total"], 1)
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product2.effective_price, 100)
+
+        # Акция закончилась - ежедневный пересчёт возвращает цену
+        SaleItem.objects.filter(pk=self.sale1.pk).update(
+            dateTo=today - timedelta(days=1)
+        )
+        call_command("refresh_prices", stdout=StringIO())
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.effective_price, Decimal("123.45"))
+
+    def test_sales_queries_do_not_depend_on_size(self):
+        """
+        Тестирование постоянного числа запросов списка акций.
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/api/sales")
+        for _ in range(3):
+            SaleItem.objects.create(
+                product=self.product2,
+                salePrice=1,
+                dateFrom=self.sale1.dateFrom,
+                dateTo=self.sale1.dateTo,
+            )
+        cache.clear()
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            self.client.get("/api/sales")
 
 
 class BannersViewTest(TestCase):
@@ -264,8 +948,24 @@ class ProductDetailViewTest(ProductTestBase):
         self.assertTrue(len(data["tags"]) > 0)
         self.assertIsInstance(data["tags"][0], dict)
         self.assertTrue(len(data["reviews"]) > 0)
+        self.assertEqual(data["reviewsTotal"], 2)
         self.assertTrue(len(data["specifications"]) > 0)
 
+    @override_settings(PRODUCT_DETAIL_REVIEWS=1)
+    def test_product_detail_embeds_latest_reviews(self):
+        """
+        Тестирование того, что в детальной странице только последние
+        отзывы, а остальные доступны по курсору.
+        """
+        response = self.client.get(f"/api/product/{self.product1.id}")
+        data = response.data
+        self.assertEqual(
+            [review["author"] for review in data["reviews"]], ["User2"]
+        )
+        self.assertEqual(data["reviewsTotal"], 2)
+        self.assertEqual(data["reviewsAverage"], Decimal("4.5"))
+        self.assertIsNotNone(data["reviewsNextCursor"])
+
 
 class ProductReviewViewTest(ProductTestBase):
     def test_add_review(self):
@@ -284,11 +984,12 @@ class ProductReviewViewTest(ProductTestBase):
             f"/api/product/{self.product1.id}/reviews", data, format="json"
         )
         self.assertEqual(response.status_code, 200)
-        self.assertTrue(len(response.data) > 0)
-        review = response.data[2]
+        review = response.data["review"]
         self.assertEqual(review["author"], author)
         self.assertEqual(review["rate"], 5)
         self.assertEqual(review["text"], text)
+        self.assertEqual(response.data["total"], 3)
+        self.assertEqual(response.data["histogram"]["5"], 2)
 
     def test_add_review_invalid(self):
         """
@@ -305,6 +1006,76 @@ class ProductReviewViewTest(ProductTestBase):
         )
         self.assertEqual(response.status_code, 400)
 
+    def test_reviews_pages(self):
+        """
+        Тестирование постраничного вывода отзывов и сводки по оценкам.
+        """
+        url = f"/api/product/{self.product1.id}/reviews"
+        response = self.client.get(url, {"limit": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total"], 2)
+        self.assertEqual(response.data["average"], Decimal("4.5"))
+        self.assertEqual(
+            response.data["histogram"],
+            {"0": 0, "1": 0, "2": 0, "3": 0, "4": 1, "5": 1},
+        )
+        authors = [item["author"] for item in response.data["items"]]
+        response = self.client.get(
+            url, {"limit": 1, "cursor": response.data["nextCursor"]}
+        )
+        authors += [item["author"] for item in response.data["items"]]
+        self.assertEqual(authors, ["User2", "User1"])
+        self.assertIsNone(response.data["nextCursor"])
+
+    def test_reviews_histogram_with_zero_rate(self):
+        """
+        Тестирование гистограммы с оценкой 0: набор и порядок ключей
+        не зависят от того, какие оценки есть.
+        """
+        url = f"/api/product/{self.product1.id}/reviews"
+        response = self.client.post(
+            url,
+            {"author": "Z", "email": "z@mail.com", "text": "плохо", "rate": 0},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(response.data["histogram"].items()),
+            [("0", 1), ("1", 0), ("2", 0), ("3", 0), ("4", 1), ("5", 1)],
+        )
+
+    def test_reviews_follow_new_review(self):
+        """
+        Тестирование того, что кэш отзывов сбрасывается новым отзывом.
+        """
+        url = f"/api/product/{self.product1.id}/reviews"
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                url,
+                {
+                    "author": "A",
+                    "email": "a@mail.com",
+                    "text": "ок",
+                    "rate": 1,
+                },
+                format="json",
+            )
+        response = self.client.get(url)
+        self.assertEqual(response.data["total"], 3)
+        self.assertEqual(response.data["items"][0]["author"], "A")
+        self.assertEqual(response.data["histogram"]["1"], 1)
+
+    def test_reviews_errors(self):
+        """
+        Тестирование неверного курсора и несуществующего продукта.
+        """
+        url = f"/api/product/{self.product1.id}/reviews"
+        response = self.client.get(url, {"cursor": "мусор"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/product/999999/reviews")
+        self.assertEqual(response.status_code, 404)
+
 
 class TagListViewTest(ProductTestBase):
     def test_get_all_tags(self):
@@ -326,3 +1097,33 @@ class TagListViewTest(ProductTestBase):
         tag_names = [tag["name"] for tag in response.data]
         self.assertIn("Игровой", tag_names)
         self.assertIn("Офисный", tag_names)
+
+    def test_tags_by_category_follow_changes(self):
+        """
+        Тестирование обновления тегов категории при изменении продуктов.
+        """
+        other = Category.objects.create(title="Другое", image=self.image)
+        self.product2.category = other
+        self.product2.save()
+        self.product1.tags.remove(self.tag1)
+
+        response = self.client.get(f"/api/tags?category={self.category.id}")
+        self.assertEqual(response.data, [])
+        response = self.client.get(f"/api/tags?category={other.id}")
+        self.assertEqual([tag["name"] for tag in response.data], ["Офисный"])
+        self.assertEqual(
+            CategoryTag.objects.get(
+                category=other, tag=self.tag2
+            ).product_count,
+            1,
+        )
+
+        self.tag1.products.add(self.product1, self.product2)
+        self.product2.delete()
+        self.assertEqual(
+            CategoryTag.objects.get(
+                category=self.category, tag=self.tag1
+            ).product_count,
+            1,
+        )
+        self.assertFalse(CategoryTag.objects.filter(category=other).exists())
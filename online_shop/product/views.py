@@ -1,22 +1,38 @@
 import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from online_shop.queryplan import plan_queryset
 from rest_framework.views import APIView
 from rest_framework.generics import RetrieveAPIView
 from rest_framework.response import Response
 from .models import (
-    Category,
+    CategoryTag,
     Product,
     Tag,
     SaleItem,
     Review,
 )
 from .serializers import (
-    CategorySerializer,
-    ProductShortSerializer,
     ProductFullSerializer,
     SaleItemSerializer,
     ReviewSerializer,
     TagSerializer,
 )
+from .cache import cache_response, conditional_response
+from .categories import category_with_descendants, get_category_tree
+from .cards import product_cards, product_cards_by_id
+from .facets import catalog_facets
+from .pagination import (
+    InvalidCursor,
+    count_results,
+    keyset_page,
+    last_page_number,
+)
+from .popular import popular_product_ids
+from .reviews import review_page, review_stats
+from .search import search_products
+from .snapshot import current_snapshot
 from rest_framework.status import (
     HTTP_404_NOT_FOUND,
     HTTP_200_OK,
@@ -30,118 +46,212 @@ log = logging.getLogger(__name__)
 class CategoryListView(APIView):
     """Вьюха для списка категорий"""
 
+    @conditional_response
+    @cache_response
     def get(self, request):
-        categories = Category.objects.filter(parent__isnull=True)
-        serializer = CategorySerializer(categories, many=True)
-        return Response(serializer.data, HTTP_200_OK)
+        return Response(get_category_tree()["roots"], HTTP_200_OK)
 
 
 class CatalogView(APIView):
     """Вьюха для каталога продуктов"""
 
-    def get(self, request):
-        products = Product.objects.all()
+    def parse_filters(self, params):
+        """Разбирает параметры фильтрации каталога"""
+
+        def price(key):
+            value = params.get(key)
+            if value is None or value == "":
+                return None
+            return float(value)
+
+        return {
+            "name": params.get("filter[name]") or None,
+            "min_price": price("filter[minPrice]"),
+            "max_price": price("filter[maxPrice]"),
+            "free_delivery": (
+                params.get("filter[freeDelivery]", "").lower() == "true"
+            ),
+            "available": params.get("filter[available]", "").lower() == "true",
+            # Родительская категория включает свои подкатегории
+            "categories": (
+                category_with_descendants(params["category"])
+                if params.get("category")
+                else None
+            ),
+            "tags": params.getlist("tags[]"),
+            # any - хотя бы один из тегов, all - все теги сразу
+            "tags_match_all": params.get("tagsMode") == "all",
+        }
 
-        # Фильтрация по названию
-        name = request.query_params.get("filter[name]")
+    def filter_products(self, filters):
+        """Фильтрует продукты по разобранным параметрам каталога"""
+        products = Product.objects.all()
 
-        if name:
-            products = products.filter(title__icontains=name)
+        # Поиск по названию (с ранжированием по релевантности)
+        if filters["name"]:
+            products = search_products(products, filters["name"])
 
         # Фильтрация по цене
-        min_price = request.query_params.get("filter[minPrice]")
-        max_price = request.query_params.get("filter[maxPrice]")
-
-        if min_price is not None and min_price != "":
-            products = products.filter(standart_price__gte=float(min_price))
-        if max_price is not None and max_price != "":
-            products = products.filter(standart_price__lte=float(max_price))
+        if filters["min_price"] is not None:
+            products = products.filter(
+                effective_price__gte=filters["min_price"]
+            )
+        if filters["max_price"] is not None:
+            products = products.filter(
+                effective_price__lte=filters["max_price"]
+            )
 
         # Фильтрация по доставке и доступности
-        free_delivery = request.query_params.get("filter[freeDelivery]")
-        available = request.query_params.get("filter[available]")
-
-        if free_delivery is not None and free_delivery != "":
-            if free_delivery.lower() == "true":
-                products = products.filter(freeDelivery=True)
-        if available is not None and available != "":
-            if available.lower() == "true":
-                products = products.filter(count__gt=0)
+        if filters["free_delivery"]:
+            products = products.filter(freeDelivery=True)
+        if filters["available"]:
+            products = products.filter(count__gt=0)
 
         # Фильтрация по категории
-        category = request.query_params.get("category")
-        if category:
-            products = products.filter(category=category)
+        if filters["categories"]:
+            products = products.filter(category_id__in=filters["categories"])
 
         # Фильтрация по тегам
-        tags = request.query_params.getlist("tags[]")
-        if tags:
-            products = products.filter(tags__id__in=tags).distinct()
+        if filters["tags"]:
+            products = products.with_tags(
+                filters["tags"], match_all=filters["tags_match_all"]
+            )
 
-        # Сортировка
-        sort = request.query_params.get("sort", "date")
-        sort_type = request.query_params.get("sortType", "dec")
+        return products
+
+    @conditional_response
+    @cache_response
+    def get(self, request):
+        params = request.query_params
+        filters = self.parse_filters(params)
+        products = self.filter_products(filters)
+        name = filters["name"]
+
+        # Фасеты для боковой панели считаются по тем же фильтрам
+        facets = None
+        if params.get("facets", "").lower() == "true":
+            facets = catalog_facets(products)
+
+        # Сортировка (id - стабильный второй ключ для одинаковых значений).
+        # При поиске без явной сортировки выдача идёт по релевантности
+        default_sort = "relevance" if name else "date"
+        sort = params.get("sort", default_sort)
+        sort_type = params.get("sortType", "dec")
         sort_map = {
-            "rating": "rating",
-            "price": "standart_price",
-            "reviews": "reviews",
+            "rating": "rating_avg",
+            "price": "effective_price",
+            "reviews": "review_count",
             "date": "date",
+            "relevance": "rank",
         }
         sort_field = sort_map.get(sort, "date")
-        if sort_type == "dec":
-            sort_field = "-" + sort_field
-        products = products.order_by(sort_field)
+        if sort_field == "rank" and not name:
+            sort_field = "date"
+        descending = sort_type == "dec"
+        limit = int(params.get("limit", 20))
+
+        # Курсорная пагинация: включается параметром cursor (пустой - первая
+        # страница), не считает COUNT и не сканирует OFFSET
+        cursor = params.get("cursor")
+        if cursor is not None:
+            try:
+                # Для курсора нужен только ключ сортировки, карточки
+                # строятся отдельно
+                key_fields = {"id", sort_field} - {"rank"}
+                page_items, next_cursor = keyset_page(
+                    products.only(*key_fields),
+                    sort_field,
+                    descending,
+                    cursor,
+                    limit,
+                )
+            except InvalidCursor as e:
+                log.warning(f"Catalog cursor rejected: {e}")
+                return Response(
+                    {"error": "Invalid cursor"}, HTTP_400_BAD_REQUEST
+                )
+            items = product_cards_by_id([item.id for item in page_items])
+            data = {"items": items, "nextCursor": next_cursor}
+            if facets is not None:
+                data["facets"] = facets
+            return Response(data, HTTP_200_OK)
+
+        prefix = "-" if descending else ""
+        products = products.order_by(prefix + sort_field, prefix + "id")
 
         # Пагинация
-        limit = int(request.query_params.get("limit", 20))
-        page = int(request.query_params.get("currentPage", 1))
-
-        total = products.count()
-        last_page = (total + limit - 1) // limit
+        page = int(params.get("currentPage", 1))
         start = (page - 1) * limit
         end = start + limit
 
-        serializer = ProductShortSerializer(products[start:end], many=True)
+        # Актуальный снимок каталога отбирает id страницы без обращения
+        # к базе; из ORM догружаются только карточки этой страницы
+        snapshot = current_snapshot()
+        if snapshot is not None and snapshot.supports(filters, sort_field):
+            ids, total = snapshot.select(
+                filters, sort_field, descending, start, limit
+            )
+            count_mode = "exact"
+            items = product_cards_by_id(ids)
+        else:
+            total, count_mode = count_results(
+                products, settings.CATALOG_EXACT_COUNT_LIMIT
+            )
+            items = product_cards(products[start:end])
+        last_page = last_page_number(total, count_mode, limit)
         log.info(f"Paginating products: page {page}, limit {limit}")
-        return Response(
-            {
-                "items": serializer.data,
-                "currentPage": page,
-                "lastPage": last_page,
-            },
-            HTTP_200_OK
-        )
+        data = {
+            "items": items,
+            "currentPage": page,
+            "lastPage": last_page,
+            "total": total,
+            "countMode": count_mode,
+        }
+        if facets is not None:
+            data["facets"] = facets
+        return Response(data, HTTP_200_OK)
 
 
 class ProductsPopularView(APIView):
     """Вьюха для популярных продуктов"""
 
+    @conditional_response
+    @cache_response
     def get(self, request):
-        products = Product.objects.order_by("sort_index", "-rating")[:8]
-        serializer = ProductShortSerializer(products, many=True)
-        return Response(serializer.data, HTTP_200_OK)
+        # sort_index, выставленный в админке, важнее рейтинга продаж;
+        # продукты без продаж идут последними по средней оценке
+        ids = popular_product_ids(settings.POPULAR_PRODUCTS_LIMIT)
+        return Response(product_cards_by_id(ids), HTTP_200_OK)
 
 
 class ProductsLimitedView(APIView):
     """Вьюха для лимитированных продуктов"""
 
+    @conditional_response
+    @cache_response
     def get(self, request):
         products = Product.objects.filter(limitedEdition=True).order_by(
             "sort_index"
         )[:16]
-        serializer = ProductShortSerializer(products, many=True)
-        return Response(serializer.data, HTTP_200_OK)
+        return Response(product_cards(products), HTTP_200_OK)
 
 
 class SalesView(APIView):
     """Вьюха для акций"""
 
+    @conditional_response
+    @cache_response
     def get(self, request):
-        sales = SaleItem.objects.all().order_by("-dateFrom")
+        sales = plan_queryset(
+            SaleItem.objects.active().order_by("-dateFrom", "id"),
+            SaleItemSerializer,
+        )
         limit = int(request.query_params.get("limit", 20))
         page = int(request.query_params.get("currentPage", 1))
-        total = sales.count()
-        last_page = (total + limit - 1) // limit
+        total, count_mode = count_results(
+            sales, settings.CATALOG_EXACT_COUNT_LIMIT
+        )
+        last_page = last_page_number(total, count_mode, limit)
         start = (page - 1) * limit
         end = start + limit
 
@@ -151,35 +261,73 @@ class SalesView(APIView):
                 "items": serializer.data,
                 "currentPage": page,
                 "lastPage": last_page,
+                "total": total,
+                "countMode": count_mode,
             },
-            HTTP_200_OK
+            HTTP_200_OK,
         )
 
 
 class BannersView(APIView):
     """Вьюха для баннеров"""
 
+    @conditional_response
+    @cache_response
     def get(self, request):
         products = Product.objects.all()[:10]
-        serializer = ProductShortSerializer(products, many=True)
-        return Response(serializer.data, HTTP_200_OK)
+        return Response(product_cards(products), HTTP_200_OK)
 
 
 class ProductDetailView(APIView):
     """Вьюха для деталей продукта"""
 
+    @conditional_response
     def get(self, request, id):
-        product = Product.objects.filter(id=id).first()
+        product = plan_queryset(
+            Product.objects.filter(id=id), ProductFullSerializer
+        ).first()
         if not product:
             log.warning(f"Product detail failed: product {id} not found")
             return Response({"error": "Product not found"}, HTTP_404_NOT_FOUND)
-        serializer = ProductFullSerializer(product)
-        return Response(serializer.data, HTTP_200_OK)
+        data = ProductFullSerializer(product).data
+        # Только последние отзывы, остальные - через /reviews по курсору
+        reviews, next_cursor = review_page(
+            product, None, settings.PRODUCT_DETAIL_REVIEWS
+        )
+        data["reviews"] = reviews
+        data["reviewsTotal"] = product.review_count
+        data["reviewsAverage"] = product.rating_avg
+        data["reviewsNextCursor"] = next_cursor
+        return Response(data, HTTP_200_OK)
 
 
 class ProductReviewView(APIView):
     """Вьюха для отзывов о продукте"""
 
+    @conditional_response
+    @cache_response
+    def get(self, request, id):
+        """Страница отзывов (новые первыми) и сводка по оценкам"""
+        product = Product.objects.filter(id=id).first()
+        if not product:
+            return Response({"error": "Product not found"}, HTTP_404_NOT_FOUND)
+        limit = min(
+            int(
+                request.query_params.get("limit", settings.REVIEWS_PAGE_LIMIT)
+            ),
+            settings.REVIEWS_PAGE_MAX_LIMIT,
+        )
+        try:
+            items, next_cursor = review_page(
+                product, request.query_params.get("cursor"), limit
+            )
+        except InvalidCursor as e:
+            log.warning(f"Reviews cursor rejected: {e}")
+            return Response({"error": "Invalid cursor"}, HTTP_400_BAD_REQUEST)
+        data = {"items": items, "nextCursor": next_cursor}
+        data.update(review_stats(product))
+        return Response(data, HTTP_200_OK)
+
     def post(self, request, id):
         product = Product.objects.filter(id=id).first()
         if not product:
@@ -187,20 +335,23 @@ class ProductReviewView(APIView):
             return Response({"error": "Product not found"}, HTTP_404_NOT_FOUND)
         serializer = ReviewSerializer(data=request.data)
         if serializer.is_valid():
-            review = Review.objects.create(
-                author=serializer.validated_data["author"],
-                email=serializer.validated_data["email"],
-                text=serializer.validated_data["text"],
-                rate=serializer.validated_data["rate"],
-            )
-            product.reviews.add(review)
-            product.save()
+            # Счётчики отзывов продукта обновляются сигналом в той же
+            # транзакции
+            with transaction.atomic():
+                review = Review.objects.create(
+                    author=serializer.validated_data["author"],
+                    email=serializer.validated_data["email"],
+                    text=serializer.validated_data["text"],
+                    rate=serializer.validated_data["rate"],
+                )
+                product.reviews.add(review)
             log.info(
                 f"Review added for product {product.id} by {review.author}"
             )
-            reviews = product.reviews.all()
-            out_serializer = ReviewSerializer(reviews, many=True)
-            return Response(out_serializer.data, HTTP_200_OK)
+            # Вместо всего списка - новый отзыв и обновлённая сводка
+            data = {"review": ReviewSerializer(review).data}
+            data.update(review_stats(product))
+            return Response(data, HTTP_200_OK)
         log.warning(
             f"Review creation failed for product {id}: {serializer.errors}"
         )
@@ -210,12 +361,18 @@ class ProductReviewView(APIView):
 class TagListView(APIView):
     """Вьюха для списка тегов"""
 
+    @conditional_response
+    @cache_response
     def get(self, request):
         category_id = request.query_params.get("category")
         if category_id:
-            tags = Tag.objects.filter(
-                products__category_id=category_id
-            ).distinct()
+            # Полусоединение с наборами тегов категории и её подкатегорий,
+            # поэтому DISTINCT не нужен
+            links = CategoryTag.objects.filter(
+                tag=OuterRef("pk"),
+                category_id__in=category_with_descendants(category_id),
+            )
+            tags = Tag.objects.filter(Exists(links))
         else:
             tags = Tag.objects.all()
         serializer = TagSerializer(tags, many=True)
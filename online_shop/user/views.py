@@ -7,6 +7,7 @@ from rest_framework.status import (
     HTTP_200_OK,
     HTTP_400_BAD_REQUEST,
 )
+from online_shop.queryplan import plan_queryset
 from .utils import parse
 from .models import Image
 from .serializers import UserProfileSerializer
@@ -93,7 +94,11 @@ class ProfileView(APIView):
     def get(self, request):
         """Получение данных профиля пользователя"""
         log.info(f"Profile data requested for user: {request.user}")
-        serializer = UserProfileSerializer(request.user)
+        # Пользователь и аватар одним запросом
+        user = plan_queryset(
+            User.objects.filter(pk=request.user.pk), UserProfileSerializer
+        ).first()
+        serializer = UserProfileSerializer(user or request.user)
         return Response(serializer.data)
 
     def post(self, request):